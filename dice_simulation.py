@@ -0,0 +1,203 @@
+'''
+Monte Carlo engine for PROBLEM 2 of loops_and_random.py: roll five dice, what
+is the chance that every die is >= the one before it?
+
+Instead of one random.randint call per die, trials are generated in large
+batches: with NumPy a batch is one (trials x dice) array of rolls checked with
+a vectorized diff; without NumPy a batch is one random.choices call checked
+column by column.  Batches can be spread over a process pool.
+
+Every batch has its own seeded random stream (NumPy SeedSequence spawn keys,
+or a per-batch seed string).  Batches are counted in order, and after each one
+the estimate and its Wilson confidence interval are updated; the run stops
+early once the interval is narrower than the requested precision.  A pool runs
+several batches at once, but batches past the stopping point are thrown away,
+so for a given seed and batch_size the result is the same for any number of
+processes.
+
+The exact answer is a counting problem: a non-decreasing sequence of 5 dice is
+a multiset of 5 faces out of 6, so there are C(6 + 5 - 1, 5) = C(10, 5) of the
+6^5 equally likely rolls.
+
+Example use:
+    result = simulate(target=0.0005)
+    print(result)
+'''
+import math
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from itertools import product
+from statistics import NormalDist
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BATCH_SIZE = 1000000
+
+Estimate = namedtuple('Estimate', 'probability low high trials successes seconds')
+
+
+def exact_probability(dice=5, sides=6):
+    '''Probability that dice rolls of sides-sided dice come out non-decreasing.
+
+    >>> exact_probability(5, 6)
+    Fraction(7, 216)
+    >>> exact_probability(5, 6) == Fraction(count_non_decreasing(5, 6), 6 ** 5)
+    True
+    >>> count_non_decreasing(5, 6) == math.comb(10, 5)
+    True
+    '''
+    return Fraction(math.comb(sides + dice - 1, dice), sides ** dice)
+
+
+def count_non_decreasing(dice=5, sides=6):
+    '''Non-decreasing rolls counted by listing all sides ** dice of them (an independent check of the formula).'''
+    return sum(1 for roll in product(range(1, sides + 1), repeat=dice)
+               if all(x <= y for x, y in zip(roll, roll[1:])))
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    # confidence interval of a binomial proportion; stays sensible for p near 0 and small samples
+    if trials == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    p = successes / trials
+    denominator = 1.0 + z * z / trials
+    center = (p + z * z / (2.0 * trials)) / denominator
+    spread = z * math.sqrt(p * (1.0 - p) / trials + z * z / (4.0 * trials * trials)) / denominator
+    return center - spread, center + spread
+
+
+def numpy_batch(seed, index, trials, dice, sides):
+    # one stream per (seed, batch index), independent of every other batch
+    generator = numpy.random.Generator(numpy.random.PCG64(numpy.random.SeedSequence(seed, spawn_key=(index,))))
+    rolls = generator.integers(1, sides + 1, size=(trials, dice), dtype=numpy.int8)
+    return int(numpy.count_nonzero((numpy.diff(rolls, axis=1) >= 0).all(axis=1)))
+
+
+def python_batch(seed, index, trials, dice, sides):
+    rng = random.Random('%s-%d' % (seed, index))
+    rolls = rng.choices(range(1, sides + 1), k=trials * dice)
+    # trial t is rolls[t * dice:(t + 1) * dice]; columns[d] holds die d of every trial
+    columns = [rolls[d::dice] for d in range(dice)]
+    ok = [True] * trials
+    for before, after in zip(columns, columns[1:]):
+        ok = [good and x <= y for good, x, y in zip(ok, before, after)]
+    return ok.count(True)
+
+
+def run_batch(job):
+    '''Number of non-decreasing rolls in batch `index` of `trials` rolls, from that batch's own seeded stream.'''
+    seed, index, trials, dice, sides, use_numpy = job
+    batch = numpy_batch if use_numpy else python_batch
+    return batch(seed, index, trials, dice, sides)
+
+
+def simulate(dice=5, sides=6, target=None, confidence=0.95, max_trials=10 ** 8, batch_size=BATCH_SIZE,
+             processes=0, seed=0, use_numpy=None, callback=None):
+    '''Estimate the probability of a non-decreasing roll.
+
+    :param target: stop once the confidence interval is at most +/- target wide
+    (None runs all max_trials)
+    :param processes: batches are run this many at a time in a process pool; 0 runs them here
+    :param use_numpy: None uses NumPy if it is installed
+    :param callback: called with the Estimate after every batch
+    :return: Estimate(probability, low, high, trials, successes, seconds)
+    '''
+    if max_trials <= 0:
+        raise ValueError("max_trials must be positive, not %r" % (max_trials,))
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    start = time.perf_counter()
+    successes = trials = 0
+    index = 0
+    done = False
+    pool = ProcessPoolExecutor(max_workers=processes) if processes else None
+    try:
+        while not done:
+            jobs = []
+            planned = trials
+            for _ in range(processes or 1):
+                size = min(batch_size, max_trials - planned)
+                if size <= 0:
+                    break
+                jobs.append((seed, index, size, dice, sides, use_numpy))
+                planned += size
+                index += 1
+            results = pool.map(run_batch, jobs) if pool else map(run_batch, jobs)
+            # batch by batch in index order, so where the run stops doesn't depend on the pool size
+            for job, batch_successes in zip(jobs, results):
+                successes += batch_successes
+                trials += job[2]
+                low, high = wilson_interval(successes, trials, confidence)
+                estimate = Estimate(successes / trials, low, high, trials, successes, time.perf_counter() - start)
+                if callback is not None:
+                    callback(estimate)
+                if trials >= max_trials or (target is not None and (high - low) / 2.0 <= target):
+                    done = True
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return estimate
+
+
+def loop_simulation(trials, dice=5, sides=6, seed=0):
+    # the loops_and_random.py way: one randint call per die
+    rng = random.Random(seed)
+    successes = 0
+    for _ in range(trials):
+        previous = 0
+        for _ in range(dice):
+            roll = rng.randint(1, sides)
+            if roll < previous:
+                break
+            previous = roll
+        else:
+            successes += 1
+    return successes / trials
+
+
+def check(trials=10 ** 6):
+    '''Cross-check the engine against the exact answer; returns True if the exact value is inside the 99.9% interval.
+
+    >>> check(200000)
+    True
+    '''
+    exact = float(exact_probability(5, 6))
+    result = simulate(max_trials=trials, confidence=0.999, seed=12345)
+    return result.low <= exact <= result.high
+
+
+if __name__ == "__main__":
+    import doctest
+
+    exact = exact_probability(5, 6)
+    print('exact: C(10,5)/6^5 = %s = %.6f' % (exact, float(exact)))
+    print('doctests passed' if doctest.testmod().failed == 0 else 'doctests FAILED')
+    print('engine agrees with the exact answer:', check())
+
+    trials = 10 ** 5
+    start = time.perf_counter()
+    p = loop_simulation(trials)
+    loop_rate = trials / (time.perf_counter() - start)
+    print('\none randint per die: %.5f  (%.0f trials/s)' % (p, loop_rate))
+
+    engine = 'numpy' if numpy is not None else 'pure python batches (numpy not installed)'
+    print('batched engine, %s:' % engine)
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else 0.0002
+
+    def report(estimate):
+        print('  %10d trials  p = %.5f  95%% CI [%.5f, %.5f]  +/- %.5f  %.0f trials/s'
+              % (estimate.trials, estimate.probability, estimate.low, estimate.high,
+                 (estimate.high - estimate.low) / 2, estimate.trials / estimate.seconds))
+
+    result = simulate(target=target, callback=report)
+    print('stopped at +/- %g after %d trials; exact value inside the interval: %s'
+          % (target, result.trials, result.low <= float(exact) <= result.high))
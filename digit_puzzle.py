@@ -0,0 +1,249 @@
+'''
+Digit puzzle solver - PROBLEM 3 of loops_and_random.py (DCBA = 4 * ABCD) and
+its generalizations, without trying every combination of digits.
+
+reverse_multiples(k, n, base) finds every n digit number N whose digits read
+backwards give k * N.  The digits are found column by column from the right,
+like long multiplication: choosing the last digit of N fixes the last digit of
+k * N (which is the first digit of N), and the carry moves on to the next
+column.  Only the right half of the digits is ever chosen, and after each
+choice the partly known N is checked against the partly known reverse(N) with
+interval bounds, so branches that cannot work are dropped early.
+
+solve_cryptarithm(puzzle) solves letter puzzles like "SEND + MORE = MONEY"
+or "ABCD * 4 = DCBA": letters are distinct digits, words don't start with 0.
+It works the same way - column by column from the right with the carry,
+choosing digits only for the letters of the words being added; the digit
+of the result in each column is then forced.
+
+Example use:
+    reverse_multiples(4, 4, distinct=True)        # [2178]
+    next(solve_cryptarithm('ABCD * 4 = DCBA'))    # {'D': 8, 'A': 2, 'C': 7, 'B': 1}
+'''
+import re
+import sys
+import time
+from collections import Counter
+
+
+def reverse_multiples(k, n, base=10, distinct=False):
+    '''Every n digit number N (in base) with reverse(N) == k * N, in increasing order.
+
+    Neither N nor reverse(N) may start with a 0.  distinct=True also requires
+    all n digits to be different.
+    '''
+    if n < 1 or (distinct and n > base):
+        return []
+    digits = [None] * n
+    used = [0] * base
+    powers = [base ** i for i in range(n)]
+    solutions = []
+
+    def allowed(position, digit):
+        # the most and least significant digits are the leading digits of N and reverse(N)
+        if digit == 0 and (position == n - 1 or position == 0):
+            return False
+        return not (distinct and used[digit])
+
+    def feasible():
+        # N and reverse(N) with every unknown digit set to 0, and to base - 1
+        low = high = reverse_low = reverse_high = 0
+        for position, digit in enumerate(digits):
+            if digit is None:
+                high += (base - 1) * powers[position]
+                reverse_high += (base - 1) * powers[n - 1 - position]
+            else:
+                low += digit * powers[position]
+                high += digit * powers[position]
+                reverse_low += digit * powers[n - 1 - position]
+                reverse_high += digit * powers[n - 1 - position]
+        return k * low <= reverse_high and k * high >= reverse_low
+
+    def search(column, carry):
+        if column == n:
+            if carry == 0:
+                solutions.append(sum(d * p for d, p in zip(digits, powers)))
+            return
+        mirror = n - 1 - column
+        if digits[column] is not None:
+            choices = [digits[column]]
+        else:
+            choices = [d for d in range(base) if allowed(column, d)]
+        for digit in choices:
+            chosen = digits[column] is None
+            if chosen:
+                digits[column] = digit
+                used[digit] += 1
+            value = k * digit + carry
+            out = value % base
+            forced = False
+            if digits[mirror] is None:
+                if allowed(mirror, out):
+                    digits[mirror] = out
+                    used[out] += 1
+                    forced = True
+                    if feasible():
+                        search(column + 1, value // base)
+            elif digits[mirror] == out and (not chosen or feasible()):
+                search(column + 1, value // base)
+            if forced:
+                used[out] -= 1
+                digits[mirror] = None
+            if chosen:
+                used[digit] -= 1
+                digits[column] = None
+
+    search(0, 0)
+    return sorted(solutions)
+
+
+def parse_cryptarithm(puzzle):
+    '''(addend words, result word) from "WORD + WORD = WORD" or "WORD * k = WORD".'''
+    match = re.fullmatch(r'\s*([A-Za-z]+)\s*\*\s*(\d+)\s*=\s*([A-Za-z]+)\s*', puzzle)
+    if match:
+        return [match.group(1).upper()] * int(match.group(2)), match.group(3).upper()
+    left, equals, right = puzzle.partition('=')
+    words = [word.strip().upper() for word in left.split('+')]
+    right = right.strip().upper()
+    if not equals or not right.isalpha() or not all(word.isalpha() for word in words):
+        raise ValueError("can't read puzzle %r; use 'WORD + WORD = WORD' or 'WORD * 4 = WORD'" % puzzle)
+    return words, right
+
+
+def solve_cryptarithm(puzzle, base=10):
+    '''Yield every {letter: digit} solution of an addition (or multiply-by-constant) letter puzzle.'''
+    addends, result = parse_cryptarithm(puzzle)
+    letters = set(result).union(*addends)
+    if len(letters) > base:
+        return
+    leading = set(word[0] for word in addends + [result] if len(word) > 1)
+    width = max(len(result), max(len(word) for word in addends))
+    # column c (from the right): how many times each letter is added, and the letter of the result
+    columns = []
+    for c in range(width):
+        added = Counter(word[-1 - c] for word in addends if c < len(word))
+        columns.append((sorted(added.items()), result[-1 - c] if c < len(result) else None))
+
+    value = {}
+    used = [False] * base
+
+    def assign(letter, digit):
+        if used[digit] or (digit == 0 and letter in leading):
+            return False
+        value[letter] = digit
+        used[digit] = True
+        return True
+
+    def unassign(letter):
+        used[value.pop(letter)] = False
+
+    def search(column, carry):
+        if column == width:
+            if carry == 0:
+                yield dict(value)
+            return
+        added, out_letter = columns[column]
+        free = [letter for letter, count in added if letter not in value]
+        for total in column_totals(added, free, 0, carry):
+            digit = total % base
+            if out_letter is None:
+                if digit == 0:
+                    for solution in search(column + 1, total // base):
+                        yield solution
+            elif out_letter in value:
+                if value[out_letter] == digit:
+                    for solution in search(column + 1, total // base):
+                        yield solution
+            elif assign(out_letter, digit):
+                for solution in search(column + 1, total // base):
+                    yield solution
+                unassign(out_letter)
+
+    def column_totals(added, free, i, carry):
+        # assign the free letters of a column one by one; yields the column total for each assignment
+        if i == len(free):
+            yield carry + sum(count * value[letter] for letter, count in added)
+            return
+        letter = free[i]
+        for digit in range(base):
+            if assign(letter, digit):
+                for total in column_totals(added, free, i + 1, carry):
+                    yield total
+                unassign(letter)
+
+    for solution in search(0, 0):
+        yield solution
+
+
+def nested_loop_abcd():
+    # the loops_and_random.py way: four nested loops over the digits
+    answers = []
+    for a in range(1, 10):
+        for b in range(10):
+            for c in range(10):
+                for d in range(1, 10):
+                    if len(set((a, b, c, d))) == 4:
+                        if 1000 * d + 100 * c + 10 * b + a == 4 * (1000 * a + 100 * b + 10 * c + d):
+                            answers.append(1000 * a + 100 * b + 10 * c + d)
+    return answers
+
+
+def brute_force_reverse_multiples(k, n, base=10):
+    # try every n digit number
+    found = []
+    for number in range(base ** (n - 1), base ** n):
+        if number % base == 0:
+            continue
+        digits = []
+        rest = number
+        while rest:
+            rest, digit = divmod(rest, base)
+            digits.append(digit)
+        reverse = 0
+        for digit in digits:
+            reverse = reverse * base + digit
+        if reverse == k * number:
+            found.append(number)
+    return found
+
+
+def digits_of(number, base):
+    # most significant digit first
+    digits = []
+    while number:
+        number, digit = divmod(number, base)
+        digits.append(digit)
+    return digits[::-1]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    answers, loop_time = timed(nested_loop_abcd)
+    solved, solve_time = timed(reverse_multiples, 4, 4, 10, True)
+    print('DCBA = 4 * ABCD: nested loops %s in %.5f s, solver %s in %.5f s' % (answers, loop_time, solved, solve_time))
+    print('ABCD * 4 = DCBA as a cryptarithm:', list(solve_cryptarithm('ABCD * 4 = DCBA')))
+    print('SEND + MORE = MONEY:', list(solve_cryptarithm('SEND + MORE = MONEY')))
+
+    max_digits = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    print('\nreverse(N) = 4 * N')
+    print('%6s %14s %14s %10s  %s' % ('digits', 'brute force', 'solver', 'solutions', 'smallest'))
+    for n in range(2, max_digits + 1):
+        solutions, elapsed = timed(reverse_multiples, 4, n)
+        if n <= 6:
+            brute, brute_time = timed(brute_force_reverse_multiples, 4, n)
+            assert brute == solutions
+            brute_column = '%12.4f s' % brute_time
+        else:
+            brute_column = '%10s' % '(~10^%d)' % n
+        print('%6d %14s %12.4f s %10d  %s' % (n, brute_column, elapsed, len(solutions), solutions[:1]))
+
+    print('\nother bases and multipliers')
+    for k, n, base in ((9, 8, 10), (2, 6, 5), (3, 7, 11), (5, 10, 16), (3, 24, 8)):
+        solutions, elapsed = timed(reverse_multiples, k, n, base)
+        print('k=%d, %2d digits, base %2d: %3d solutions in %.4f s, e.g. digits %s'
+              % (k, n, base, len(solutions), elapsed, digits_of(solutions[0], base) if solutions else '-'))
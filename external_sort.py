@@ -0,0 +1,243 @@
+'''
+External merge sort for line-oriented text files of any size.
+
+    python external_sort.py search_files/dictionary.txt sorted.txt --unique
+
+The input is read in runs that fit a memory budget; each run is sorted and
+written to a temporary file, and the runs are then merged with a heap
+(heapq.merge), which holds only one line per run in memory.  So peak memory
+depends on the budget, not on the size of the input.
+
+  - processes > 0 sorts and writes the runs in a process pool while the next
+    runs are being read
+  - unique=True drops duplicate lines, within runs and again while merging
+  - more runs than max_open files are merged in several passes
+
+Line endings are normalized to '\\n'.  key, if given, is called with each line
+without its line ending.
+
+Example use:
+    external_sort(['search_files/super_villains.txt'], 'villains_sorted.txt', key=str.lower)
+'''
+import argparse
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+SEARCH_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_files')
+
+MEMORY_LIMIT = 64 * 1024 * 1024
+
+MAX_OPEN = 256
+
+# how far over memory_limit the benchmark lets peak memory go (the line overhead estimate, merge buffers)
+BUDGET_SLACK = 1.25
+
+# bytes of a str object beyond its characters, used to measure runs against the memory budget
+LINE_OVERHEAD = sys.getsizeof('')
+
+
+def read_lines(paths, skip_blank=False):
+    # every line of every file, each ending in exactly one '\n'
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if skip_blank and not line.strip():
+                    continue
+                yield line if line.endswith('\n') else line + '\n'
+
+
+def line_key(key):
+    # a sort key for lines ending in '\n', from a key for lines without it
+    if key is None:
+        return None
+    return lambda line: key(line[:-1])
+
+
+def unique_lines(lines, key):
+    # consecutive duplicates (equal keys, or equal lines without a key) collapsed to the first
+    if key is None:
+        return (line for line, _ in groupby(lines))
+    return (next(group) for _, group in groupby(lines, key))
+
+
+def sort_run(job):
+    '''Path of a new temporary file in directory holding the run's lines sorted by key (deduplicated if unique).'''
+    lines, key, reverse, unique, directory = job
+    key = line_key(key)
+    lines.sort(key=key, reverse=reverse)
+    f = tempfile.NamedTemporaryFile('w', dir=directory, suffix='.run', delete=False)
+    with f:
+        f.writelines(unique_lines(lines, key) if unique else lines)
+    # empty the run, so a caller still holding the list doesn't keep it alive while reading the next one
+    lines[:] = []
+    return f.name
+
+
+def runs_of(lines, memory_limit, max_lines=None):
+    # lists of lines taking about memory_limit bytes (or max_lines lines) each
+    run = []
+    size = 0
+    for line in lines:
+        run.append(line)
+        size += len(line) + LINE_OVERHEAD + 8
+        if size >= memory_limit or (max_lines is not None and len(run) >= max_lines):
+            yield run
+            run = []
+            size = 0
+    if run:
+        yield run
+
+
+def merge_runs(runs, output, key, reverse, unique):
+    files = [open(run) for run in runs]
+    try:
+        key = line_key(key)
+        merged = heapq.merge(*files, key=key, reverse=reverse)
+        if unique:
+            merged = unique_lines(merged, key)
+        with open(output, 'w') as out:
+            out.writelines(merged)
+    finally:
+        for f in files:
+            f.close()
+
+
+def external_sort(inputs, output, key=None, reverse=False, unique=False, memory_limit=MEMORY_LIMIT,
+                  max_lines=None, processes=0, max_open=MAX_OPEN, temp_dir=None, skip_blank=False):
+    '''Sort the lines of one or more files into output.
+
+    :param inputs: a path or a list of paths
+    :param memory_limit: approximate bytes of lines held in memory at once; with
+    a process pool it is shared between the run being read and the runs in flight
+    :param max_lines: also end a run after this many lines
+    :param skip_blank: leave out lines that are empty or only whitespace
+    :param processes: worker processes sorting runs; 0 sorts them in this process.
+    key has to be picklable (e.g. str.lower, not a lambda) to be sent to them.
+    :return: the number of sorted runs that were merged
+    '''
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if max_open < 2:
+        raise ValueError("max_open must be at least 2, not %r" % (max_open,))
+    directory = tempfile.mkdtemp(dir=temp_dir)
+    try:
+        lines = read_lines(inputs, skip_blank)
+        if processes:
+            budget = memory_limit // (processes + 1)
+            runs = []
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                pending = []
+                for run in runs_of(lines, budget, max_lines):
+                    pending.append((pool.submit(sort_run, (run, key, reverse, unique, directory)), run))
+                    del run
+                    # never more runs in flight than workers, so memory stays within the budget
+                    if len(pending) >= processes:
+                        future, sent = pending.pop(0)
+                        runs.append(future.result())
+                        # the worker sorted a copy; drop ours as soon as it is written
+                        sent[:] = []
+                for future, sent in pending:
+                    runs.append(future.result())
+                    sent[:] = []
+        else:
+            runs = [sort_run((run, key, reverse, unique, directory))
+                    for run in runs_of(lines, memory_limit, max_lines)]
+        count = len(runs)
+
+        while len(runs) > max_open:
+            merged = []
+            for i in range(0, len(runs), max_open):
+                group = runs[i:i + max_open]
+                path = tempfile.NamedTemporaryFile('w', dir=directory, suffix='.run', delete=False)
+                path.close()
+                merge_runs(group, path.name, key, reverse, unique)
+                for run in group:
+                    os.remove(run)
+                merged.append(path.name)
+            runs = merged
+        merge_runs(runs, output, key, reverse, unique)
+    finally:
+        shutil.rmtree(directory)
+    return count
+
+
+def benchmark(copies=(1, 4, 16), memory_limit=4 * 1024 * 1024):
+    '''Peak traced memory of external_sort on the dictionary repeated and shuffled, for growing sizes.
+
+    Raises AssertionError if the peak goes more than BUDGET_SLACK over memory_limit.
+    '''
+    import random
+    import tracemalloc
+
+    with open(os.path.join(SEARCH_FILES, 'dictionary.txt')) as f:
+        words = [line.strip() for line in f if line.strip()]
+    directory = tempfile.mkdtemp()
+    rows = []
+    try:
+        for n in copies:
+            source = os.path.join(directory, 'words_%d.txt' % n)
+            rng = random.Random(n)
+            with open(source, 'w') as f:
+                for copy in range(n):
+                    shuffled = words[:]
+                    rng.shuffle(shuffled)
+                    f.write('\n'.join('%s%d' % (word, copy) for word in shuffled) + '\n')
+            output = os.path.join(directory, 'sorted.txt')
+            tracemalloc.start()
+            start = time.perf_counter()
+            runs = external_sort(source, output, memory_limit=memory_limit)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if peak > memory_limit * BUDGET_SLACK:
+                raise AssertionError('peak memory %d bytes on a budget of %d' % (peak, memory_limit))
+            rows.append((os.path.getsize(source), runs, elapsed, peak))
+            os.remove(source)
+    finally:
+        shutil.rmtree(directory)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sort the lines of files too big for memory.')
+    parser.add_argument('files', nargs='*', metavar='file',
+                        help='files to sort followed by the output file '
+                             '(default: sort dictionary.txt and super_villains.txt into the temp directory)')
+    parser.add_argument('--unique', action='store_true', help='drop duplicate lines')
+    parser.add_argument('--ignore-case', action='store_true', help='compare lines case-insensitively')
+    parser.add_argument('--reverse', action='store_true')
+    parser.add_argument('--memory', type=float, default=MEMORY_LIMIT / 2 ** 20, help='memory budget in MB')
+    parser.add_argument('--processes', type=int, default=0, help='sort runs in this many processes')
+    parser.add_argument('--benchmark', action='store_true', help='show peak memory for growing inputs')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print('%12s %6s %9s %14s' % ('input bytes', 'runs', 'seconds', 'peak memory'))
+        for size, runs, elapsed, peak in benchmark():
+            print('%12d %6d %9.2f %11.1f MB' % (size, runs, elapsed, peak / 1e6))
+        return
+
+    if len(args.files) < 2:
+        # no arguments: sort the two word lists in search_files next to themselves
+        for name in ('dictionary.txt', 'super_villains.txt'):
+            source = os.path.join(SEARCH_FILES, name)
+            output = os.path.join(tempfile.gettempdir(), 'sorted_' + name)
+            runs = external_sort(source, output, key=str.lower if args.ignore_case else None,
+                                 reverse=args.reverse, unique=args.unique, processes=args.processes,
+                                 memory_limit=int(args.memory * 2 ** 20))
+            print('%s -> %s (%d runs)' % (name, output, runs))
+        return
+    runs = external_sort(args.files[:-1], args.files[-1], key=str.lower if args.ignore_case else None,
+                         reverse=args.reverse, unique=args.unique, processes=args.processes,
+                         memory_limit=int(args.memory * 2 ** 20))
+    print('merged %d runs into %s' % (runs, args.files[-1]))
+
+
+if __name__ == "__main__":
+    main()
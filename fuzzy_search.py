@@ -0,0 +1,187 @@
+'''
+Approximate (fuzzy) search over word lists such as search_files/dictionary.txt
+and search_files/super_villains.txt.
+
+FuzzyIndex finds every entry within a given edit (Levenshtein) distance of a
+query without computing the distance to every entry:
+  1. length filter  - an entry more than k characters longer or shorter than
+                      the query cannot be within distance k
+  2. q-gram filter  - each edit destroys at most q of a word's q-grams, so an
+                      entry within distance k shares at least
+                      max(len) + q - 1 - k * q q-grams with the query
+  3. verification   - the remaining candidates get a Levenshtein distance
+                      that gives up as soon as it must exceed k
+Matching ignores case; results are the original entries.
+
+Example use:
+    villains = FuzzyIndex.from_file('search_files/super_villains.txt')
+    villains.search('Aldrik Fox', 2)        # [(2, 'Aldric Foxe')]
+    villains.search_many(['Arachne', 'Amanita'], 3)
+'''
+import os
+import time
+from array import array
+from collections import Counter
+
+SEARCH_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_files')
+
+Q = 3
+PAD = '\0'
+
+
+def levenshtein(a, b, limit=None):
+    '''Edit distance between a and b.  With a limit, returns limit + 1 as soon as the distance must exceed it.'''
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = previous[j - 1] if ca == cb else previous[j - 1] + 1
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current.append(cost)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def qgrams(word, q=Q):
+    '''The padded q-grams of a word, numbered by occurrence so repeated q-grams stay distinct.'''
+    padded = PAD * (q - 1) + word + PAD * (q - 1)
+    seen = Counter()
+    grams = []
+    for i in range(len(padded) - q + 1):
+        gram = padded[i:i + q]
+        grams.append((gram, seen[gram]))
+        seen[gram] += 1
+    return grams
+
+
+class FuzzyIndex(object):
+    '''q-gram index of a list of strings, answering edit distance queries.'''
+
+    def __init__(self, entries, q=Q):
+        self.q = q
+        self.entries = list(dict.fromkeys(entries))
+        self.keys = [entry.upper() for entry in self.entries]
+        # q-gram -> ids of the entries containing it
+        self.postings = {}
+        # length -> ids of the entries of that length
+        self.by_length = {}
+        for i, key in enumerate(self.keys):
+            self.by_length.setdefault(len(key), array('I')).append(i)
+            for gram in qgrams(key, q):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array('I')
+                posting.append(i)
+        # distances computed by the last search, to show how much the filters save
+        self.verified = 0
+
+    @classmethod
+    def from_file(cls, path, q=Q):
+        with open(path) as f:
+            return cls([line.strip() for line in f if line.strip()], q)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, key, k):
+        # ids of the entries passing the length and q-gram filters
+        low, high = len(key) - k, len(key) + k
+        threshold = len(key) + self.q - 1 - k * self.q
+        if threshold <= 0:
+            # too short for the q-gram filter to rule anything out
+            found = []
+            for length in range(max(low, 0), high + 1):
+                found.extend(self.by_length.get(length, ()))
+            return found
+        shared = Counter()
+        for gram in qgrams(key, self.q):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                shared.update(posting)
+        keys = self.keys
+        found = []
+        for i, count in shared.items():
+            length = len(keys[i])
+            # the bound uses the longer of the two strings
+            if low <= length <= high and count >= max(length, len(key)) + self.q - 1 - k * self.q:
+                found.append(i)
+        return found
+
+    def search(self, query, k=2):
+        '''[(distance, entry)] for every entry within edit distance k of query, closest first.'''
+        key = query.upper()
+        matches = []
+        candidates = self.candidates(key, k)
+        self.verified = len(candidates)
+        for i in candidates:
+            distance = levenshtein(key, self.keys[i], k)
+            if distance <= k:
+                matches.append((distance, self.entries[i]))
+        matches.sort()
+        return matches
+
+    def search_many(self, queries, k=2):
+        '''search() for every query, as a list parallel to queries.  Repeated queries are only searched once.'''
+        queries = list(queries)
+        results = {}
+        for query in queries:
+            if query.upper() not in results:
+                results[query.upper()] = self.search(query, k)
+        return [results[query.upper()] for query in queries]
+
+    def closest(self, query, max_k=3):
+        # the nearest entries, widening the search one edit at a time
+        for k in range(max_k + 1):
+            matches = self.search(query, k)
+            if matches:
+                return matches
+        return []
+
+
+def brute_force(entries, query, k=2):
+    # distance to every entry, for comparison
+    key = query.upper()
+    matches = [(levenshtein(key, entry.upper(), k), entry) for entry in entries]
+    return sorted(match for match in matches if match[0] <= k)
+
+
+if __name__ == "__main__":
+    villains = FuzzyIndex.from_file(os.path.join(SEARCH_FILES, 'super_villains.txt'))
+    for name in ('Aldrik Fox', 'Arachne the Gruesom', 'amanita malificent'):
+        print('%-22s -> %s' % (name, villains.closest(name)))
+
+    start = time.perf_counter()
+    dictionary = FuzzyIndex.from_file(os.path.join(SEARCH_FILES, 'dictionary.txt'))
+    print('\nindexed %d words in %.2f s' % (len(dictionary), time.perf_counter() - start))
+
+    queries = ['CHESHIRE', 'WONDERLAND', 'RABBIT', 'JABBERWOCK', 'TULGEY', 'ALICE', 'GRYPHON',
+               'CATERPILLAR', 'TORTOISE', 'HATTER', 'DORMOUSE', 'TWEEDLEDUM']
+    for k in (1, 2):
+        verified = 0
+        start = time.perf_counter()
+        indexed = []
+        for query in queries:
+            indexed.append(dictionary.search(query, k))
+            verified += dictionary.verified
+        index_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scanned = [brute_force(dictionary.entries, query, k) for query in queries]
+        scan_time = time.perf_counter() - start
+
+        print('k=%d  index %.3f s (%d distances)  brute force %.3f s (%d distances)  %.0fx  same results: %s'
+              % (k, index_time, verified, scan_time, len(dictionary) * len(queries),
+                 scan_time / index_time, indexed == scanned))
+    print('JABBERWOCK within 2:', dictionary.search('JABBERWOCK', 2))
+    print('batch:', dictionary.search_many(['tulgey', 'gryphon', 'tulgey'], 1))
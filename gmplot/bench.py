@@ -0,0 +1,82 @@
+# Throughput benchmark for GoogleMapPlotter.draw
+# Run with:  python -m gmplot.bench [max_points]
+# Prints draw() throughput per map size, then the per phase render report
+# (see gmplot.profiling) of the largest map.
+
+import random
+import sys
+import time
+
+from .gmplot import GoogleMapPlotter
+
+
+def synthetic_map(n, seed=0, compact=False):
+    """Build a map around Chicago with n scattered markers, an n point heatmap,
+    a grid, and n / 10 points worth of random walk paths and circles."""
+    rng = random.Random(seed)
+    lats = [41.88 + rng.uniform(-0.2, 0.2) for _ in range(n)]
+    lngs = [-87.63 + rng.uniform(-0.2, 0.2) for _ in range(n)]
+    gmap = GoogleMapPlotter(41.88, -87.63, 11, compact=compact)
+    gmap.grid(41.68, 42.08, 0.02, -87.83, -87.43, 0.02)
+    gmap.scatter(lats, lngs, c='r', marker=True)
+    gmap.heatmap(lats, lngs, radius=20)
+    walk_length = 1000
+    for start in range(0, n // 10, walk_length):
+        lat, lng = lats[start], lngs[start]
+        path_lats, path_lngs = [], []
+        for _ in range(walk_length):
+            lat += rng.gauss(0, 0.001)
+            lng += rng.gauss(0, 0.001)
+            path_lats.append(lat)
+            path_lngs.append(lng)
+        gmap.plot(path_lats, path_lngs, c='b', edge_width=2)
+    gmap.scatter(lats[:n // 10 // 36], lngs[:n // 10 // 36], c='g', size=200, marker=False)
+    return gmap
+
+
+def bench_draw(sizes, compact=False):
+    """Time draw() for each map size and return a list of (points, seconds, bytes)."""
+    results = []
+    for n in sizes:
+        gmap = synthetic_map(n, compact=compact)
+        start = time.perf_counter()
+        html = gmap.draw(None)
+        elapsed = time.perf_counter() - start
+        results.append((n, elapsed, len(html)))
+    return results
+
+
+def profile_draw(n, compact=False):
+    """Draw a synthetic map of n points with instrumentation on and return its RenderReport."""
+    gmap = synthetic_map(n, compact=compact)
+    profiler = gmap.profile()
+    gmap.draw(None)
+    return profiler.report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    max_points = int(argv[0]) if argv else 10 ** 6
+    sizes = []
+    n = 1000
+    while n < max_points:
+        sizes.append(n)
+        n *= 10
+    # always measure max_points itself, even when it is below 1000 or not a power of ten
+    sizes.append(max_points)
+
+    for compact in (False, True):
+        print('compact=%s' % compact)
+        print('%10s %10s %14s %12s' % ('points', 'seconds', 'points/sec', 'MB'))
+        for n, elapsed, size in bench_draw(sizes, compact):
+            print('%10d %10.3f %14.0f %12.2f' % (n, elapsed, n / elapsed, size / 1e6))
+        print()
+
+    for compact in (False, True):
+        print('render report, %d points, compact=%s' % (sizes[-1], compact))
+        print(profile_draw(sizes[-1], compact))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Python-side marker clustering for gmplot.
+# Markers are merged on a grid whose cells are a fixed number of screen pixels
+# wide at each zoom level, so the page only has to swap between precomputed levels.
+# The grid is laid out in web mercator (longitude, and latitude stretched the
+# way the map stretches it), so cells stay square on screen at any latitude.
+
+import math
+
+from .layers import Coords
+from .tiling import bin_points, degrees_per_pixel
+
+MAX_ZOOM = 21
+
+# Mercator latitudes are clamped to the map's own limit.
+MAX_LATITUDE = 85.0511287798
+
+
+def to_mercator(coords):
+    """Coords with each latitude replaced by its web mercator y, in degrees (equal to longitude degrees on screen)."""
+    ys = [math.degrees(math.asinh(math.tan(math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)))))
+          for lat in coords.lats]
+    return Coords(ys, coords.lngs)
+
+
+def from_mercator(coords):
+    """Inverse of to_mercator."""
+    return Coords([math.degrees(math.atan(math.sinh(math.radians(y)))) for y in coords.lats], coords.lngs)
+
+
+def cluster_levels(coords, min_zoom=0, max_zoom=MAX_ZOOM, cell_pixels=60):
+    """Cluster points for every zoom level from min_zoom to max_zoom.
+
+    Returns a list of (zoom, Coords of cluster centers, array of counts) in
+    ascending zoom order. Levels are built from the finest zoom downwards,
+    each one binning the previous level's clusters (cells double in width per
+    zoom level and nest exactly), so only the first level touches every point.
+    A level is left out when it is identical to the next coarser one; the page
+    falls back to the nearest level at or below the current zoom.
+    """
+    levels = []
+    centers, counts = bin_points(to_mercator(Coords.from_pairs(coords)), degrees_per_pixel(max_zoom) * cell_pixels)
+    levels.append((max_zoom, centers, counts))
+    for zoom in range(max_zoom - 1, min_zoom - 1, -1):
+        centers, counts = bin_points(centers, degrees_per_pixel(zoom) * cell_pixels, counts)
+        levels.append((zoom, centers, counts))
+    levels.reverse()
+
+    distinct = [levels[0]]
+    for level in levels[1:]:
+        if len(level[1]) != len(distinct[-1][1]):
+            distinct.append(level)
+    return [(zoom, from_mercator(centers), counts) for zoom, centers, counts in distinct]
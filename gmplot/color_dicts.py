@@ -154,3 +154,9 @@ html_color_codes = {
     'yellowgreen': '#9ACD32'
 }
 
+
+# Every accepted color name (matplotlib one letter codes included) mapped
+# straight to its html code, so resolving a color is a single lookup.
+color_table = dict(html_color_codes)
+for _short_name, _name in mpl_color_map.items():
+    color_table[_short_name] = html_color_codes[_name]
@@ -0,0 +1,275 @@
+# Pluggable geocoder backends for gmplot.
+#  - GoogleGeocoder: the Google geocoding web API (needs requests)
+#  - GazetteerGeocoder: offline lookups in a local csv gazetteer
+#  - CachedGeocoder: an on-disk LRU cache in front of any other backend
+# geocode_many resolves a batch of addresses concurrently through any of them.
+
+import bisect
+import csv
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+GOOGLE_GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+
+# Cache writes (new results and the recency of hits) made between two commits to disk.
+WRITE_BATCH = 1000
+
+
+def normalize_address(address):
+    """Lower case, punctuation dropped and whitespace collapsed, e.g. ' 233 S. Wacker Dr ' -> '233 s wacker dr'."""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', address.lower()).split())
+
+
+class Geocoder(object):
+    """Base class: turns an address string into a (lat, lng) tuple, or raises LookupError."""
+
+    def geocode(self, address):
+        raise NotImplementedError
+
+
+class GoogleGeocoder(Geocoder):
+
+    def __init__(self, apikey='', timeout=10.0):
+        self.apikey = apikey
+        self.timeout = timeout
+
+    def geocode(self, address):
+        import requests
+
+        params = {'address': address}
+        if self.apikey:
+            params['key'] = self.apikey
+        response = requests.get(GOOGLE_GEOCODE_URL, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        results = response.json().get('results')
+        if not results:
+            raise LookupError("no geocoding result for %r" % (address,))
+        latlng_dict = results[0]['geometry']['location']
+        return latlng_dict['lat'], latlng_dict['lng']
+
+
+class GazetteerGeocoder(Geocoder):
+    """Offline geocoder over a csv file of known places.
+
+    The file needs a header row with address, latitude and longitude columns.
+    Addresses are normalized and kept sorted, so an exact lookup or a prefix
+    search is a binary search.
+    Example use:
+    gazetteer = GazetteerGeocoder('chicago_places.csv')
+    gmap = gmplot.GoogleMapPlotter.from_geocode('Willis Tower', geocoder=gazetteer)
+    """
+
+    def __init__(self, csv_path, address_column='address', lat_column='lat', lng_column='lng'):
+        entries = {}
+        with open(csv_path, newline='') as f:
+            for row in csv.DictReader(f):
+                key = normalize_address(row[address_column])
+                entries.setdefault(key, (row[address_column].strip(),
+                                         float(row[lat_column]), float(row[lng_column])))
+        self.keys = sorted(entries)
+        self.entries = [entries[key] for key in self.keys]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit=10):
+        """Up to `limit` (address, lat, lng) entries whose normalized address starts with `prefix`."""
+        prefix = normalize_address(prefix)
+        results = []
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(results) < limit and self.keys[i].startswith(prefix):
+            results.append(self.entries[i])
+            i += 1
+        return results
+
+    def geocode(self, address):
+        """Exact match on the normalized address, else the first entry it is a prefix of."""
+        key = normalize_address(address)
+        if not key:
+            # an empty key is a prefix of every address
+            raise LookupError("%r is not an address" % (address,))
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i].startswith(key):
+            return self.entries[i][1], self.entries[i][2]
+        raise LookupError("%r is not in the gazetteer" % (address,))
+
+
+class CachedGeocoder(Geocoder):
+    """Least recently used cache of geocoding results, stored in a sqlite file.
+
+    Only successful lookups are cached. Once more than `maxsize` addresses are
+    stored, the least recently used ones are evicted. path=None keeps the cache
+    in memory. Writes are committed in batches of WRITE_BATCH (hits only note
+    their recency in memory until then) and on flush()/close(); a crash loses
+    at most the writes since the last commit.
+    """
+
+    def __init__(self, backend, path=None, maxsize=100000):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS geocode '
+                        '(address TEXT PRIMARY KEY, lat REAL, lng REAL, used INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS geocode_used ON geocode (used)')
+        self.clock = self.db.execute('SELECT COALESCE(MAX(used), 0) FROM geocode').fetchone()[0]
+        self.count = self.db.execute('SELECT COUNT(*) FROM geocode').fetchone()[0]
+        self.recent = {}
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        """Commit buffered writes (new results and the recency of hits) to the file."""
+        with self.lock:
+            self._commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def _flush_recent(self):
+        # call with the lock held
+        if self.recent:
+            self.db.executemany('UPDATE geocode SET used = ? WHERE address = ?',
+                                [(used, key) for key, used in self.recent.items()])
+            self.recent.clear()
+
+    def _commit(self):
+        # call with the lock held
+        self._flush_recent()
+        self.db.commit()
+        self.uncommitted = 0
+
+    def _wrote(self):
+        # call with the lock held, after each cache write
+        self.uncommitted += 1
+        if self.uncommitted >= WRITE_BATCH:
+            self._commit()
+
+    def geocode(self, address):
+        key = normalize_address(address)
+        with self.lock:
+            row = self.db.execute('SELECT lat, lng FROM geocode WHERE address = ?', (key,)).fetchone()
+            if row is not None:
+                self.clock += 1
+                self.recent[key] = self.clock
+                self._wrote()
+                self.hits += 1
+                return row
+            self.misses += 1
+
+        # Outside the lock, so slow backends are queried concurrently by geocode_many.
+        lat, lng = self.backend.geocode(address)
+
+        with self.lock:
+            self.clock += 1
+            self.recent.pop(key, None)
+            if self.db.execute('INSERT OR IGNORE INTO geocode VALUES (?, ?, ?, ?)',
+                               (key, lat, lng, self.clock)).rowcount:
+                self.count += 1
+            else:
+                # another thread cached the address while the backend was queried
+                self.db.execute('UPDATE geocode SET lat = ?, lng = ?, used = ? WHERE address = ?',
+                                (lat, lng, self.clock, key))
+            if self.count > self.maxsize:
+                # evicting has to see the latest recency of every cached address
+                self._flush_recent()
+                excess = self.count - self.maxsize
+                self.db.execute('DELETE FROM geocode WHERE address IN '
+                                '(SELECT address FROM geocode ORDER BY used LIMIT ?)', (excess,))
+                self.count -= excess
+            self._wrote()
+        return lat, lng
+
+
+def geocode_many(addresses, geocoder, max_workers=8, errors=None):
+    """Geocode many addresses concurrently.
+
+    Returns a list parallel to `addresses` holding (lat, lng) tuples, or None
+    for addresses the geocoder could not resolve. Duplicate addresses are only
+    looked up once. A failing lookup (no result, or a backend error such as a
+    timeout) never stops the batch: pass a dict as `errors` to get the
+    exception for each failed address, e.g. to retry the ones that timed out.
+    """
+    addresses = list(addresses)
+    unique = list(dict.fromkeys(addresses))
+
+    def lookup(address):
+        try:
+            return tuple(geocoder.geocode(address))
+        except Exception as error:
+            if errors is not None:
+                errors[address] = error
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(unique, pool.map(lookup, unique)))
+    return [results[address] for address in addresses]
+
+
+if __name__ == "__main__":
+    # Offline check of the gazetteer, the cache and geocode_many; nothing here touches the network.
+    import os
+    import shutil
+    import tempfile
+
+    class CountingGeocoder(Geocoder):
+        """Wraps a backend and counts the lookups that reach it."""
+
+        def __init__(self, backend):
+            self.backend = backend
+            self.calls = 0
+
+        def geocode(self, address):
+            self.calls += 1
+            return self.backend.geocode(address)
+
+    directory = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(directory, 'places.csv')
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['address', 'lat', 'lng'])
+            writer.writerow(['Willis Tower, 233 S. Wacker Dr', 41.8789, -87.6359])
+            writer.writerow(['Wrigley Field', 41.9484, -87.6553])
+            writer.writerow(['Navy Pier', 41.8917, -87.6086])
+        gazetteer = GazetteerGeocoder(csv_path)
+        assert gazetteer.geocode('willis tower') == (41.8789, -87.6359)
+        assert [entry[0] for entry in gazetteer.search('w')] == ['Willis Tower, 233 S. Wacker Dr', 'Wrigley Field']
+        for address in ('Sears Tower', '', '!!'):
+            try:
+                gazetteer.geocode(address)
+            except LookupError:
+                pass
+            else:
+                raise AssertionError('%r should not be found' % (address,))
+        print('gazetteer: %d places, exact, prefix and missing lookups ok' % len(gazetteer))
+
+        backend = CountingGeocoder(gazetteer)
+        cache = CachedGeocoder(backend, os.path.join(directory, 'cache.db'), maxsize=2)
+        cache.geocode('Willis Tower')
+        cache.geocode('Wrigley Field')
+        cache.geocode('WILLIS TOWER!')          # hit: normalizes to the cached address
+        cache.geocode('Navy Pier')              # miss, evicts Wrigley Field, the least recently used
+        assert (cache.hits, cache.misses, backend.calls, len(cache)) == (1, 3, 3, 2)
+        cache.geocode('Wrigley Field')          # evicted, so back to the backend
+        assert backend.calls == 4
+        cache.close()
+        reopened = CachedGeocoder(backend, os.path.join(directory, 'cache.db'), maxsize=2)
+        assert reopened.geocode('wrigley field') == (41.9484, -87.6553) and backend.calls == 4
+        print('cache: hits, misses, eviction and reopening from disk ok')
+
+        errors = {}
+        results = geocode_many(['Navy Pier', 'Nowhere', 'Navy Pier', 'Wrigley Field'], reopened, errors=errors)
+        assert results[0] == results[2] == (41.8917, -87.6086) and results[1] is None
+        assert list(errors) == ['Nowhere'] and isinstance(errors['Nowhere'], LookupError)
+        reopened.close()
+        print('geocode_many: %s' % results)
+    finally:
+        shutil.rmtree(directory)
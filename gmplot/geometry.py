@@ -0,0 +1,199 @@
+# Geometry helpers for gmplot: great-circle circles and path simplification.
+# NumPy is optional: with it, circles are computed as one (N, k, 2) array and
+# simplification measures distances a whole span at a time; without it the same
+# results come from plain Python loops.
+
+import functools
+import math
+
+from .layers import Coords
+from .tiling import degrees_per_pixel
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS_KM = 6378.8
+
+DEFAULT_SEGMENTS = 36
+
+# Spans shorter than this are measured in plain Python even with NumPy, where array overhead dominates.
+NUMPY_MIN_SPAN = 64
+
+
+@functools.lru_cache(maxsize=None)
+def bearings(segments=DEFAULT_SEGMENTS):
+    """(sin, cos) of each of the evenly spaced bearings around a circle, computed once per segment count."""
+    step = 2.0 * math.pi / segments
+    return tuple((math.sin(i * step), math.cos(i * step)) for i in range(segments))
+
+
+def circle_array(lats, lngs, radius, segments=DEFAULT_SEGMENTS):
+    """Circles of `radius` meters around N centers as one (N, segments, 2) NumPy array of (lat, lng).
+
+    Needs NumPy. Every center's polygon is computed in the same few array
+    operations, with the bearing sin/cos table shared by all of them.
+    """
+    if numpy is None:
+        raise ImportError("circle_array needs numpy; use circles() without it")
+    d = (radius / 1000.0) / EARTH_RADIUS_KM
+    table = numpy.array(bearings(segments))
+    sin_tc = table[:, 0]
+    cos_tc = table[:, 1]
+    lat1 = numpy.radians(numpy.asarray(lats, dtype=float))[:, None]
+    lng1 = numpy.radians(numpy.asarray(lngs, dtype=float))[:, None]
+    sin_lat = numpy.sin(lat1)
+    b = numpy.cos(lat1) * math.sin(d)
+    sin_y = sin_lat * math.cos(d) + b * cos_tc
+    result = numpy.empty((len(lat1), segments, 2))
+    result[:, :, 0] = numpy.degrees(numpy.arcsin(sin_y))
+    result[:, :, 1] = numpy.degrees((lng1 - numpy.arctan2(sin_tc * b, math.cos(d) - sin_lat * sin_y) + math.pi)
+                                    % (2.0 * math.pi) - math.pi)
+    return result
+
+
+def circles(lats, lngs, radius, segments=DEFAULT_SEGMENTS):
+    """Polygons approximating circles of `radius` meters around every (lat, lng) center.
+
+    Returns one Coords of `segments` vertices per center. With NumPy they are
+    rows of circle_array(); without it, the bearing trig is still shared by all
+    centers, and each center only needs its own sin/cos(lat).
+    """
+    if numpy is not None:
+        result = circle_array(lats, lngs, radius, segments)
+        cycle_lats = numpy.ascontiguousarray(result[:, :, 0])
+        cycle_lngs = numpy.ascontiguousarray(result[:, :, 1])
+        return [Coords(row_lats, row_lngs) for row_lats, row_lngs in zip(cycle_lats, cycle_lngs)]
+    d = (radius / 1000.0) / EARTH_RADIUS_KM
+    sin_d = math.sin(d)
+    cos_d = math.cos(d)
+    table = bearings(segments)
+    asin = math.asin
+    atan2 = math.atan2
+    pi = math.pi
+    two_pi = 2.0 * math.pi
+    to_rad = math.pi / 180.0
+    to_deg = 180.0 / math.pi
+
+    result = []
+    for lat, lng in zip(lats, lngs):
+        lat1 = lat * to_rad
+        lng1 = lng * to_rad
+        sin_lat = math.sin(lat1)
+        cos_lat = math.cos(lat1)
+        a = sin_lat * cos_d
+        b = cos_lat * sin_d
+        # sin(y) is the asin argument itself, so it never has to be recomputed.
+        sin_ys = [a + b * cos_tc for sin_tc, cos_tc in table]
+        cycle_lats = [asin(sin_y) * to_deg for sin_y in sin_ys]
+        cycle_lngs = [(((lng1 - atan2(sin_tc * b, cos_d - sin_lat * sin_y)) + pi) % two_pi - pi) * to_deg
+                      for (sin_tc, cos_tc), sin_y in zip(table, sin_ys)]
+        result.append(Coords(cycle_lats, cycle_lngs))
+    return result
+
+
+def simplify(coords, tolerance):
+    """Douglas-Peucker simplification of a path.
+
+    Drops every vertex that lies within `tolerance` degrees of the simplified
+    line. Longitudes are scaled by cos(latitude) so the tolerance is roughly
+    the same distance in every direction. Returns (Coords, number of vertices
+    removed). The first and last vertices are always kept. With NumPy each
+    span's distances are computed as one array operation (see _simplify_numpy).
+    """
+    n = len(coords)
+    if n < 3:
+        return coords, 0
+    if numpy is not None:
+        return _simplify_numpy(coords, tolerance)
+    lats = coords.lats
+    scale = math.cos(math.radians(sum(lats) / n))
+    xs = [lng * scale for lng in coords.lngs]
+    ys = lats
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    tolerance_sq = tolerance * tolerance
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0.0:
+            distances = [(x - x0) ** 2 + (y - y0) ** 2
+                         for x, y in zip(xs[first + 1:last], ys[first + 1:last])]
+        else:
+            # Squared perpendicular distance to the infinite line through the end points.
+            distances = [((x - x0) * dy - (y - y0) * dx) ** 2 / length_sq
+                         for x, y in zip(xs[first + 1:last], ys[first + 1:last])]
+        farthest = max(distances)
+        if farthest > tolerance_sq:
+            index = first + 1 + distances.index(farthest)
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+
+    kept = keep.count(1)
+    if kept == n:
+        return coords, 0
+    simplified = Coords([lat for lat, k in zip(lats, keep) if k],
+                        [lng for lng, k in zip(coords.lngs, keep) if k])
+    return simplified, n - kept
+
+
+def _simplify_numpy(coords, tolerance):
+    # simplify() measuring each span of NUMPY_MIN_SPAN or more vertices as one array; keeps exactly the same vertices
+    n = len(coords)
+    ys = numpy.frombuffer(coords.lats, dtype=float)
+    lngs = numpy.frombuffer(coords.lngs, dtype=float)
+    xs = lngs * math.cos(math.radians(ys.sum() / n))
+    x_list = xs.tolist()
+    y_list = ys.tolist()
+    keep = numpy.zeros(n, dtype=bool)
+    keep[0] = keep[n - 1] = True
+    tolerance_sq = tolerance * tolerance
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = x_list[first], y_list[first]
+        dx, dy = x_list[last] - x0, y_list[last] - y0
+        length_sq = dx * dx + dy * dy
+        if last - first < NUMPY_MIN_SPAN:
+            span = zip(x_list[first + 1:last], y_list[first + 1:last])
+            if length_sq == 0.0:
+                distances = [(x - x0) ** 2 + (y - y0) ** 2 for x, y in span]
+            else:
+                distances = [((x - x0) * dy - (y - y0) * dx) ** 2 / length_sq for x, y in span]
+            largest = max(distances)
+            farthest = distances.index(largest)
+        else:
+            span_x = xs[first + 1:last] - x0
+            span_y = ys[first + 1:last] - y0
+            if length_sq == 0.0:
+                distances = span_x ** 2 + span_y ** 2
+            else:
+                distances = (span_x * dy - span_y * dx) ** 2 / length_sq
+            farthest = int(distances.argmax())
+            largest = distances[farthest]
+        if largest > tolerance_sq:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    kept = int(keep.sum())
+    if kept == n:
+        return coords, 0
+    return Coords(ys[keep], lngs[keep]), n - kept
+
+
+def zoom_tolerance(zoom, center_lat, pixels=1.0):
+    """Simplification tolerance (in degrees of latitude) equal to `pixels` screen pixels at a zoom level."""
+    return degrees_per_pixel(zoom) * pixels * math.cos(math.radians(center_lat))
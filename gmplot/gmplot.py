@@ -6,15 +6,40 @@
 #  - updated maxIntensity kwarg to match google map API
 # -  updated methods for color arguments to match google map API
 
+import io
 import json
 import math
 import os
-import requests
 import warnings
 
-from .color_dicts import mpl_color_map, html_color_codes
+from .cluster import MAX_ZOOM, cluster_levels
+from .color_dicts import color_table, mpl_color_map, html_color_codes
+from .geocoding import GoogleGeocoder
+from .geometry import DEFAULT_SEGMENTS, circles, simplify, zoom_tolerance
+from .layers import Coords
+from .profiling import RenderProfiler
+from .spatial import RTree
+from .styles import resolve_style, style_js
+from .tiling import (bin_geohash, bin_points, degrees_per_pixel, geohash_grid_edges, geohash_precision,
+                     grid_lines, tile_grid_edges)
 
 
+# draw() writes through a buffer this large so the file is flushed in big chunks.
+WRITE_BUFFER_SIZE = 1 << 20
+
+LATLNG_TEMPLATE = 'new google.maps.LatLng(%f, %f),\n'
+
+WEIGHTED_LATLNG_TEMPLATE = '{location: new google.maps.LatLng(%f, %f), weight: %g},\n'
+
+MARKER_TEMPLATE = (
+    '\t\tvar latlng = new google.maps.LatLng(%f, %f);\n'
+    '\t\tvar marker = new google.maps.Marker({\n'
+    '\t\ttitle: "%s",\n'
+    '\t\tposition: latlng\n'
+    '\t\t});\n'
+    '\t\tmarker.setMap(map);\n'
+    '\n')
+
 
 def safe_iter(var):
     try:
@@ -23,123 +48,360 @@ def safe_iter(var):
         return [var]
 
 
+def latlng_lines(coords):
+    """Render (lat, lng) pairs as one block of LatLng constructor lines."""
+    template = LATLNG_TEMPLATE
+    return ''.join([template % (coord[0], coord[1]) for coord in coords])
+
+
+def flat_values(coords):
+    """Render (lat, lng) pairs as comma separated numbers lat,lng,lat,lng,... (no brackets)."""
+    return ','.join(['%f,%f' % (coord[0], coord[1]) for coord in coords])
+
+
+def flat_array(coords):
+    """Render (lat, lng) pairs as one flat JS number array [lat, lng, lat, lng, ...]."""
+    return '[' + flat_values(coords) + ']'
+
+
+def weighted_latlng_lines(coords, weights):
+    """Render points with weights as WeightedLocation object literals, one per line."""
+    template = WEIGHTED_LATLNG_TEMPLATE
+    return ''.join([template % (lat, lng, weight) for (lat, lng), weight in zip(coords, weights)])
+
+
+def weighted_flat_array(coords, weights, weight_format='%g'):
+    """Render points with weights as one flat JS number array [lat, lng, weight, ...]."""
+    template = '%f,%f,' + weight_format
+    return '[' + ','.join([template % (lat, lng, weight)
+                           for (lat, lng), weight in zip(coords, weights)]) + ']'
+
+
+# Emitted once per page in compact mode; turns packed arrays back into LatLngs in the browser.
+COMPACT_HELPERS = (
+    '\t\tfunction gmplot_latlngs(data) {\n'
+    '\t\t\tvar out = new Array(data.length / 2);\n'
+    '\t\t\tfor (var i = 0; i < data.length; i += 2) {\n'
+    '\t\t\t\tout[i / 2] = new google.maps.LatLng(data[i], data[i + 1]);\n'
+    '\t\t\t}\n'
+    '\t\t\treturn out;\n'
+    '\t\t}\n'
+    '\t\tfunction gmplot_weighted(data) {\n'
+    '\t\t\tvar out = new Array(data.length / 3);\n'
+    '\t\t\tfor (var i = 0; i < data.length; i += 3) {\n'
+    '\t\t\t\tout[i / 3] = {location: new google.maps.LatLng(data[i], data[i + 1]), weight: data[i + 2]};\n'
+    '\t\t\t}\n'
+    '\t\t\treturn out;\n'
+    '\t\t}\n'
+    '\n')
+
+COMPACT_MARKERS_HEAD = '\t\tvar marker_data = '
+
+COMPACT_MARKERS_TAIL = (
+    ';\n'
+    '\t\tvar marker_titles = %s;\n'
+    '\t\tfor (var i = 0; i < marker_data.length; i += 2) {\n'
+    '\t\t\tnew google.maps.Marker({\n'
+    '\t\t\t\ttitle: typeof marker_titles === "string" ? marker_titles : marker_titles[i / 2],\n'
+    '\t\t\t\tposition: new google.maps.LatLng(marker_data[i], marker_data[i + 1]),\n'
+    '\t\t\t\tmap: map\n'
+    '\t\t\t});\n'
+    '\t\t}\n'
+    '\n')
+
+COMPACT_MARKERS_TEMPLATE = COMPACT_MARKERS_HEAD + '%s' + COMPACT_MARKERS_TAIL
+
+# The whole grid is one Data layer holding a single MultiLineString, built from
+# a flat array of line end points [lat1, lng1, lat2, lng2, ...].
+GRID_TEMPLATE = (
+    '\t\tvar grid_lines = %s;\n'
+    '\t\tvar grid_paths = new Array(grid_lines.length / 4);\n'
+    '\t\tfor (var i = 0; i < grid_paths.length; i++) {\n'
+    '\t\t\tgrid_paths[i] = [{lat: grid_lines[4 * i], lng: grid_lines[4 * i + 1]},\n'
+    '\t\t\t\t{lat: grid_lines[4 * i + 2], lng: grid_lines[4 * i + 3]}];\n'
+    '\t\t}\n'
+    '\t\tvar grid = new google.maps.Data({map: map, style: {clickable: false, '
+    'strokeColor: "%s", strokeOpacity: %f, strokeWeight: %d}});\n'
+    '\t\tgrid.add({geometry: new google.maps.Data.MultiLineString(grid_paths)});\n'
+    '\n')
+
+CLUSTERED_MARKERS_TEMPLATE = (
+    '\t\tvar cluster_levels = %s;\n'
+    '\t\tvar cluster_zooms = %s;\n'
+    '\t\tvar cluster_title = %s;\n'
+    '\t\tvar cluster_markers = [];\n'
+    '\t\tvar cluster_level = null;\n'
+    '\t\tfunction gmplot_show_clusters() {\n'
+    '\t\t\tvar level = cluster_zooms[0];\n'
+    '\t\t\tfor (var i = 0; i < cluster_zooms.length && cluster_zooms[i] <= map.getZoom(); i++) {\n'
+    '\t\t\t\tlevel = cluster_zooms[i];\n'
+    '\t\t\t}\n'
+    '\t\t\tif (level === cluster_level) {\n'
+    '\t\t\t\treturn;\n'
+    '\t\t\t}\n'
+    '\t\t\tcluster_level = level;\n'
+    '\t\t\tfor (var i = 0; i < cluster_markers.length; i++) {\n'
+    '\t\t\t\tcluster_markers[i].setMap(null);\n'
+    '\t\t\t}\n'
+    '\t\t\tvar data = cluster_levels[level];\n'
+    '\t\t\tcluster_markers = new Array(data.length / 3);\n'
+    '\t\t\tfor (var i = 0; i < data.length; i += 3) {\n'
+    '\t\t\t\tvar count = data[i + 2];\n'
+    '\t\t\t\tcluster_markers[i / 3] = new google.maps.Marker({\n'
+    '\t\t\t\t\tposition: new google.maps.LatLng(data[i], data[i + 1]),\n'
+    '\t\t\t\t\tlabel: count > 1 ? String(count) : null,\n'
+    '\t\t\t\t\ttitle: count > 1 ? count + " markers" : cluster_title,\n'
+    '\t\t\t\t\tmap: map\n'
+    '\t\t\t\t});\n'
+    '\t\t\t}\n'
+    '\t\t}\n'
+    '\t\tmap.addListener("zoom_changed", gmplot_show_clusters);\n'
+    '\t\tgmplot_show_clusters();\n'
+    '\n')
+
+
 class GoogleMapPlotter(object):
 
-    def __init__(self, center_lat, center_lng, zoom, apikey=''):
+    def __init__(self, center_lat, center_lng, zoom, apikey='', compact=False, simplify=None):
+        """
+        :param compact: if True, draw() emits every layer as one packed numeric array
+        plus a small client-side loop instead of one JS statement per coordinate.
+        Much smaller files and faster page loads for large maps.
+        :param simplify: tolerance in screen pixels at the map's zoom. If set, draw() runs
+        Douglas-Peucker over every plot() path and polygon() shape first, and records the
+        number of dropped vertices in self.vertices_removed.
+
+        Call profile() to time every draw() phase by phase (see gmplot.profiling).
+        """
         self.center = (float(center_lat), float(center_lng))
         self.zoom = int(zoom)
         self.apikey = str(apikey)
+        self.compact = bool(compact)
+        self.simplify_pixels = simplify
+        self.vertices_removed = 0
+        self.profiler = None
         self.grids = None
         self.paths = []
         self.shapes = []
         self.points = []
+        self.marker_layers = []
+        self.clustering = None
+        self.index = None
+        # Bumped by every change to the markers or shapes, so spatial_index() knows to rebuild.
+        self.layer_version = 0
         self.heatmap_points = []
         self.ground_overlays = []
         self.radpoints = []
+        # Every style used by this map, in first-use order; compact output declares each once.
+        self.styles = []
+        self.style_ids = {}
         self.gridsetting = None
+        self.grid_snap = None
+        self.grid_style = None
         self.coloricon = os.path.join(os.path.dirname(__file__), 'markers/%s.png')
         self.color_dict = mpl_color_map
         self.html_color_codes = html_color_codes
 
     @classmethod
-    def from_geocode(cls, location_string, zoom=13):
-        lat, lng = cls.geocode(location_string)
+    def from_geocode(cls, location_string, zoom=13, geocoder=None):
+        lat, lng = cls.geocode(location_string, geocoder)
         return cls(lat, lng, zoom)
 
     @classmethod
-    def geocode(self, location_string):
-        geocode = requests.get(
-            'http://maps.googleapis.com/maps/api/geocode/json?address="%s"' % location_string)
-        geocode = json.loads(geocode.text)
-        latlng_dict = geocode['results'][0]['geometry']['location']
-        return latlng_dict['lat'], latlng_dict['lng']
-
-    def grid(self, slat, elat, latin, slng, elng, lngin):
+    def geocode(self, location_string, geocoder=None):
+        """
+        :param geocoder: any gmplot.geocoding backend (e.g. a GazetteerGeocoder for offline
+        use, or a CachedGeocoder). Default queries the Google geocoding API.
+        :return: (lat, lng) tuple
+        """
+        if geocoder is None:
+            geocoder = GoogleGeocoder()
+        return geocoder.geocode(location_string)
+
+    def grid(self, slat, elat, latin, slng, elng, lngin, snap=None):
+        """Draw grid lines over [slat, elat] x [slng, elng], latin by lngin degrees apart.
+
+        :param snap: None draws the grid as given; 'tile' snaps it to the slippy-map
+        tiles and 'geohash' to the geohash cells closest in width to lngin, covering
+        the same area.
+        """
+        if snap not in (None, 'tile', 'geohash'):
+            raise ValueError("unknown grid snap %r; use None, 'tile' or 'geohash'" % (snap,))
         self.gridsetting = [slat, elat, latin, slng, elng, lngin]
+        self.grid_snap = snap
+        self.grid_style = self._process_kwargs({"color": "#000000"})
+
+    def grid_edges(self):
+        """(latitude edges, longitude edges) of the cells of the grid set with grid(), both ascending."""
+        if self.gridsetting is None:
+            raise ValueError("call grid() first")
+        slat, elat, latin, slng, elng, lngin = self.gridsetting
+        if self.grid_snap == 'tile':
+            return tile_grid_edges(slat, elat, slng, elng, lngin)
+        if self.grid_snap == 'geohash':
+            return geohash_grid_edges(slat, elat, slng, elng, lngin)
+        # The small epsilon keeps float noise such as 0.2 / 0.05 = 4.0000000001 from adding a row.
+        rows = int(math.ceil((elat - slat) / latin - 1e-9))
+        columns = int(math.ceil((elng - slng) / lngin - 1e-9))
+        return ([slat + row * latin for row in range(rows + 1)],
+                [slng + column * lngin for column in range(columns + 1)])
+
+    def cluster_markers(self, min_zoom=0, max_zoom=None, cell_pixels=60):
+        """Merge nearby markers into numbered cluster markers when the map is drawn.
+
+        Clusters are precomputed for every zoom level between min_zoom and max_zoom
+        (markers closer than about cell_pixels on screen are merged), and the page
+        swaps between those levels as the user zooms. max_zoom defaults to four
+        levels past the map's zoom; zooming further keeps the max_zoom clusters.
+        """
+        if max_zoom is None:
+            max_zoom = min(self.zoom + 4, MAX_ZOOM)
+        self.clustering = (min_zoom, max_zoom, cell_pixels)
+
+    def all_markers(self):
+        """Coords of every marker, single markers first and then each scatter layer."""
+        return Coords.concat([self.points] + [layer[0] for layer in self.marker_layers])
+
+    def spatial_index(self):
+        """R-tree over every marker and every circle/polygon bounding box.
+
+        Items are ('marker', lat, lng) or ('shape', index into self.shapes). The
+        tree is cached and only rebuilt after markers or shapes have changed.
+        """
+        key = (self.layer_version, len(self.points), len(self.marker_layers), len(self.shapes))
+        if self.index is None or self.index[0] != key:
+            boxes = []
+            items = []
+            for lat, lng in self.all_markers():
+                boxes.append((lat, lat, lng, lng))
+                items.append(('marker', lat, lng))
+            for i, (shape, settings) in enumerate(self.shapes):
+                shape = Coords.from_pairs(shape)
+                if len(shape):
+                    boxes.append((min(shape.lats), max(shape.lats), min(shape.lngs), max(shape.lngs)))
+                    items.append(('shape', i))
+            self.index = (key, RTree(boxes, items))
+        return self.index[1]
+
+    def within(self, south, north, west, east):
+        """Markers and shapes intersecting a bounding box (see spatial_index for the item format)."""
+        return self.spatial_index().search(south, north, west, east)
+
+    def nearest(self, lat, lng, k=1):
+        """The k markers or shapes closest to (lat, lng), nearest first."""
+        return [item for distance, item in self.spatial_index().nearest(lat, lng, k)]
+
+    def dedupe_markers(self, tolerance):
+        """Drop every marker within `tolerance` degrees (in both lat and lng) of an earlier one.
+
+        :return: number of markers removed
+        """
+        markers = self.all_markers()
+        tree = RTree([(lat, lat, lng, lng) for lat, lng in markers], range(len(markers)))
+        removed = bytearray(len(markers))
+        for i, (lat, lng) in enumerate(markers):
+            if removed[i]:
+                continue
+            for j in tree.search(lat - tolerance, lat + tolerance, lng - tolerance, lng + tolerance):
+                if j > i:
+                    removed[j] = 1
+
+        self.points = [point for point, gone in zip(self.points, removed) if not gone]
+        offset = len(removed) - sum(len(layer[0]) for layer in self.marker_layers)
+        layers = []
+        for coords, color, title in self.marker_layers:
+            keep = removed[offset:offset + len(coords)]
+            offset += len(coords)
+            kept = Coords([lat for lat, gone in zip(coords.lats, keep) if not gone],
+                          [lng for lng, gone in zip(coords.lngs, keep) if not gone])
+            if len(kept):
+                layers.append((kept, color, title))
+        self.marker_layers = layers
+        self.layer_version += 1
+        return removed.count(1)
+
+    def grid_counts(self):
+        """Number of markers in each cell of the grid set with grid(), as {(row, column): count}.
+
+        Row r spans latitudes [slat + r * latin, slat + (r + 1) * latin), and
+        columns likewise for longitudes; on a snapped grid they are the tile or
+        geohash cells from grid_edges(). Empty cells are left out.
+        """
+        lat_edges, lng_edges = self.grid_edges()
+        tree = self.spatial_index()
+        counts = {}
+        for row, (south, north) in enumerate(zip(lat_edges, lat_edges[1:])):
+            for column, (west, east) in enumerate(zip(lng_edges, lng_edges[1:])):
+                count = sum(1 for item in tree.search(south, north, west, east)
+                            if item[0] == 'marker' and item[1] < north and item[2] < east)
+                if count:
+                    counts[(row, column)] = count
+        return counts
 
     def marker(self, lat, lng, color='#FF0000', c=None, title="no implementation"):
         if c:
             color = c
-        color = self.color_dict.get(color, color)
-        color = self.html_color_codes.get(color, color)
+        color = color_table.get(color, color)
         self.points.append((lat, lng, color[1:], title))
+        self.layer_version += 1
 
-    def scatter(self, lats, lngs, color=None, size=None, marker=True, c=None, s=None, **kwargs):
+    def scatter(self, lats, lngs, color=None, size=None, marker=True, c=None, s=None,
+                segments=DEFAULT_SEGMENTS, **kwargs):
         color = color or c
         size = size or s or 40
         kwargs["color"] = color
         kwargs["size"] = size
         settings = self._process_kwargs(kwargs)
-        for lat, lng in zip(lats, lngs):
-            if marker:
-                self.marker(lat, lng, settings['color'])
-            else:
-                self.circle(lat, lng, size, **settings)
+        coords = Coords(lats, lngs).validate()
+        if marker:
+            self.marker_layers.append((coords, settings['color'][1:], "no implementation"))
+        else:
+            for cycle in circles(coords.lats, coords.lngs, size, segments):
+                self.shapes.append((cycle, settings))
+        self.layer_version += 1
 
-    def circle(self, lat, lng, radius, color=None, c=None, **kwargs):
+    def circle(self, lat, lng, radius, color=None, c=None, segments=DEFAULT_SEGMENTS, **kwargs):
         color = color or c
         kwargs.setdefault('face_alpha', 0.5)
         kwargs.setdefault('face_color', "#000000")
         kwargs.setdefault("color", color)
         settings = self._process_kwargs(kwargs)
-        path = self.get_cycle(lat, lng, radius)
+        path = circles((lat,), (lng,), radius, segments)[0]
         self.shapes.append((path, settings))
+        self.layer_version += 1
 
     def _process_kwargs(self, kwargs):
-        settings = dict()
-        settings["edge_color"] = kwargs.get("color", None) or \
-                                 kwargs.get("edge_color", None) or \
-                                 kwargs.get("ec", None) or \
-                                 "#000000"
-
-        settings["edge_alpha"] = kwargs.get("alpha", None) or \
-                                 kwargs.get("edge_alpha", None) or \
-                                 kwargs.get("ea", None) or \
-                                 1.0
-        settings["edge_width"] = kwargs.get("edge_width", None) or \
-                                 kwargs.get("ew", None) or \
-                                 1.0
-        settings["face_alpha"] = kwargs.get("alpha", None) or \
-                                 kwargs.get("face_alpha", None) or \
-                                 kwargs.get("fa", None) or \
-                                 0.3
-        settings["face_color"] = kwargs.get("color", None) or \
-                                 kwargs.get("face_color", None) or \
-                                 kwargs.get("fc", None) or \
-                                 "#000000"
-
-        settings["color"] = kwargs.get("color", None) or \
-                            kwargs.get("c", None) or \
-                            settings["edge_color"] or \
-                            settings["face_color"]
-
-        # Need to replace "plum" with "#DDA0DD" and "c" with "#00FFFF" (cyan).
-        for key, color in settings.items():
-            if 'color' in key:
-                color = self.color_dict.get(color, color)
-                color = self.html_color_codes.get(color, color)
-                settings[key] = color
-
-        settings["closed"] = kwargs.get("closed", None)
-
+        settings = resolve_style(kwargs)
+        if id(settings) not in self.style_ids:
+            self.style_ids[id(settings)] = len(self.styles)
+            self.styles.append(settings)
         return settings
 
     def plot(self, lats, lngs, color=None, c=None, **kwargs):
         color = color or c
         kwargs.setdefault("color", color)
         settings = self._process_kwargs(kwargs)
-        path = zip(lats, lngs)
+        path = Coords(lats, lngs).validate()
         self.paths.append((path, settings))
 
-    def heatmap(self, lats, lngs, threshold=10, radius=10, gradient=None, opacity=0.6, maxIntensity=1, dissipating=True):
+    def heatmap(self, lats, lngs, threshold=10, radius=10, gradient=None, opacity=0.6, maxIntensity=1, dissipating=True,
+                aggregate=None):
         """
         :param lats: list of latitudes
         :param lngs: list of longitudes
         :param maxIntensity:(int) max frequency to use when plotting. Default (None) uses max value on map domain.
         :param threshold:
         :param radius: The hardest param. Example (string):
+        :param aggregate: None sends every raw point to the browser. 'grid' or 'geohash' first bins
+        the points into cells about half a heatmap radius wide at the map's zoom, and sends each cell
+        as one point weighted by its point count, so maxIntensity keeps its meaning.
         :return:
         """
+        settings = self._heatmap_settings(threshold, radius, gradient, opacity, maxIntensity, dissipating)
+        heatmap_points, weights = self._heatmap_data(Coords(lats, lngs).validate(), radius, aggregate)
+        self.heatmap_points.append((heatmap_points, settings, weights))
+
+    def _heatmap_settings(self, threshold, radius, gradient, opacity, maxIntensity, dissipating):
         settings = {}
         # Try to give anyone using threshold a heads up.
         if threshold != 10:
@@ -150,12 +412,18 @@ class GoogleMapPlotter(object):
         settings['opacity'] = opacity
         settings['maxIntensity'] = maxIntensity
         settings['dissipating'] = dissipating
-        settings = self._process_heatmap_kwargs(settings)
-
-        heatmap_points = []
-        for lat, lng in zip(lats, lngs):
-            heatmap_points.append((lat, lng))
-        self.heatmap_points.append((heatmap_points, settings))
+        return self._process_heatmap_kwargs(settings)
+
+    def _heatmap_data(self, points, radius, aggregate):
+        """(points, weights) to plot for a heatmap; weights is None unless the points were aggregated."""
+        if not aggregate:
+            return points, None
+        cell = degrees_per_pixel(self.zoom) * max(radius, 2) / 2.0
+        if aggregate == 'grid':
+            return bin_points(points, cell)
+        if aggregate == 'geohash':
+            return bin_geohash(points, geohash_precision(cell))
+        raise ValueError("aggregate must be None, 'grid' or 'geohash', not %r" % (aggregate,))
 
     def _process_heatmap_kwargs(self, settings_dict):
         settings_string = ''
@@ -204,159 +472,235 @@ class GoogleMapPlotter(object):
         color = color or c
         kwargs.setdefault("color", color)
         settings = self._process_kwargs(kwargs)
-        shape = zip(lats, lngs)
+        shape = Coords(lats, lngs).validate()
         self.shapes.append((shape, settings))
+        self.layer_version += 1
 
-    def draw(self, htmlfile):
+    def draw(self, htmlfile=None):
         """Create the html file which include one google map and all points and paths. If 
         no string is provided, return the raw html.
         """
-        f = open(htmlfile, 'w')
-        f.write('<html>\n')
-        f.write('<head>\n')
-        f.write(
-            '<meta name="viewport" content="initial-scale=1.0, user-scalable=no" />\n')
-        f.write(
-            '<meta http-equiv="content-type" content="text/html; charset=UTF-8"/>\n')
-        f.write('<title>Google Maps - gmplot </title>\n')
-        if self.apikey:
-            f.write('<script type="text/javascript" src="https://maps.googleapis.com/maps/api/js?libraries=visualization&sensor=true_or_false&key=%s"></script>\n' % self.apikey )
-        else:
-            f.write('<script type="text/javascript" src="https://maps.googleapis.com/maps/api/js?libraries=visualization&sensor=true_or_false"></script>\n' )
-        f.write('<script type="text/javascript">\n')
-        f.write('\tfunction initialize() {\n')
-        self.write_map(f)
+        if htmlfile is None:
+            f = io.StringIO()
+            self.write_html(f)
+            return f.getvalue()
+        with open(htmlfile, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+            self.write_html(f)
+
+    def profile(self, callback=None):
+        """Instrument every following draw(): time each write_* phase and count its bytes and coordinates.
+
+        The latest gmplot.profiling.RenderReport is kept as self.profiler.report,
+        and callback(report) is called after each draw. Set self.profiler = None
+        to switch instrumentation off again.
+        :return: the RenderProfiler
+        """
+        self.profiler = RenderProfiler(callback)
+        return self.profiler
+
+    def write_html(self, f):
+        if self.profiler is not None:
+            self.profiler.write_html(self, f)
+            return
+        self.vertices_removed = 0
+        self.write_head(f)
         self.write_grids(f)
         self.write_points(f)
         self.write_paths(f)
         self.write_shapes(f)
         self.write_heatmap(f)
         self.write_ground_overlay(f)
-        f.write('\t}\n')
-        f.write('</script>\n')
-        f.write('</head>\n')
+        self.write_foot(f)
+
+    def write_head(self, f):
         f.write(
-            '<body style="margin:0px; padding:0px;" onload="initialize()">\n')
+            '<html>\n'
+            '<head>\n'
+            '<meta name="viewport" content="initial-scale=1.0, user-scalable=no" />\n'
+            '<meta http-equiv="content-type" content="text/html; charset=UTF-8"/>\n'
+            '<title>Google Maps - gmplot </title>\n')
+        if self.apikey:
+            f.write('<script type="text/javascript" src="https://maps.googleapis.com/maps/api/js?libraries=visualization&sensor=true_or_false&key=%s"></script>\n' % self.apikey )
+        else:
+            f.write('<script type="text/javascript" src="https://maps.googleapis.com/maps/api/js?libraries=visualization&sensor=true_or_false"></script>\n' )
+        f.write('<script type="text/javascript">\n'
+                '\tfunction initialize() {\n')
+        self.write_map(f)
+        if self.compact:
+            f.write(COMPACT_HELPERS)
+            f.write('\t\tvar gmplot_styles = [\n' +
+                    ''.join(['\t\t\t%s,\n' % style_js(style) for style in self.styles]) +
+                    '\t\t];\n'
+                    '\n')
+
+    def write_foot(self, f):
         f.write(
-            '\t<div id="map_canvas" style="width: 100%; height: 100%;"></div>\n')
-        f.write('</body>\n')
-        f.write('</html>\n')
-        f.close()
+            '\t}\n'
+            '</script>\n'
+            '</head>\n'
+            '<body style="margin:0px; padding:0px;" onload="initialize()">\n'
+            '\t<div id="map_canvas" style="width: 100%; height: 100%;"></div>\n'
+            '</body>\n'
+            '</html>\n')
 
     #############################################
     # # # # # # Low level Map Drawing # # # # # #
     #############################################
 
+    # Each write_* method renders its whole layer into one string and hands it
+    # to f.write in a single call, so large maps are not dominated by tiny writes.
+
     def write_grids(self, f):
         if self.gridsetting is None:
             return
-        slat = self.gridsetting[0]
-        elat = self.gridsetting[1]
-        latin = self.gridsetting[2]
-        slng = self.gridsetting[3]
-        elng = self.gridsetting[4]
-        lngin = self.gridsetting[5]
-        self.grids = []
-
-        r = [
-            slat + float(x) * latin for x in range(0, int((elat - slat) / latin))]
-        for lat in r:
-            self.grids.append(
-                [(lat + latin / 2.0, slng + lngin / 2.0), (lat + latin / 2.0, elng + lngin / 2.0)])
-
-        r = [
-            slng + float(x) * lngin for x in range(0, int((elng - slng) / lngin))]
-        for lng in r:
-            self.grids.append(
-                [(slat + latin / 2.0, lng + lngin / 2.0), (elat + latin / 2.0, lng + lngin / 2.0)])
-
-        for line in self.grids:
-            settings = self._process_kwargs({"color": "#000000"})
-            self.write_polyline(f, line, settings)
+        slat, elat, latin, slng, elng, lngin = self.gridsetting
+        if self.grid_snap is None:
+            # Lines run through the cell centers of the unsnapped grid.
+            lat_positions = [slat + (x + 0.5) * latin for x in range(int((elat - slat) / latin))]
+            lng_positions = [slng + (x + 0.5) * lngin for x in range(int((elng - slng) / lngin))]
+            self.grids = grid_lines(lat_positions, lng_positions, slat + latin / 2.0, elat + latin / 2.0,
+                                    slng + lngin / 2.0, elng + lngin / 2.0)
+        else:
+            lat_edges, lng_edges = self.grid_edges()
+            self.grids = grid_lines(lat_edges, lng_edges, lat_edges[0], lat_edges[-1],
+                                    lng_edges[0], lng_edges[-1])
+        settings = self.grid_style
+        f.write(GRID_TEMPLATE % (flat_array(self.grids), settings.get('color') or settings.get('edge_color'),
+                                 settings.get('edge_alpha'), settings.get('edge_width')))
 
     def write_points(self, f):
-        for point in self.points:
-            self.write_point(f, point[0], point[1], point[2], point[3])
+        if self.clustering:
+            self.write_clustered_points(f)
+            return
+        if self.compact:
+            self.write_compact_points(f)
+            return
+        f.write(''.join([MARKER_TEMPLATE % (point[0], point[1], point[3])
+                         for point in self.points]))
+        for coords, color, title in self.marker_layers:
+            f.write(''.join([MARKER_TEMPLATE % (lat, lng, title) for lat, lng in coords]))
 
     def get_cycle(self, lat, lng, rad):
         # unit of radius: meter
-        cycle = []
-        d = (rad / 1000.0) / 6378.8
-        lat1 = (math.pi / 180.0) * lat
-        lng1 = (math.pi / 180.0) * lng
-
-        r = [x * 10 for x in range(36)]
-        for a in r:
-            tc = (math.pi / 180.0) * a
-            y = math.asin(
-                math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(tc))
-            dlng = math.atan2(math.sin(
-                tc) * math.sin(d) * math.cos(lat1), math.cos(d) - math.sin(lat1) * math.sin(y))
-            x = ((lng1 - dlng + math.pi) % (2.0 * math.pi)) - math.pi
-            cycle.append(
-                (float(y * (180.0 / math.pi)), float(x * (180.0 / math.pi))))
-        return cycle
+        return list(circles((lat,), (lng,), rad)[0])
+
+    def simplified(self, coords, min_vertices=2):
+        """Apply the simplify stage to one path, keeping the original if too few vertices would survive."""
+        if not self.simplify_pixels:
+            return coords
+        tolerance = zoom_tolerance(self.zoom, self.center[0], self.simplify_pixels)
+        result, removed = simplify(coords, tolerance)
+        if len(result) < min_vertices:
+            return coords
+        self.vertices_removed += removed
+        return result
 
     def write_paths(self, f):
         for path, settings in self.paths:
-            self.write_polyline(f, path, settings)
+            self.write_polyline(f, self.simplified(path), settings)
 
     def write_shapes(self, f):
         for shape, settings in self.shapes:
-            self.write_polygon(f, shape, settings)
+            self.write_polygon(f, self.simplified(shape, 3), settings)
 
     # TODO: Add support for mapTypeId: google.maps.MapTypeId.SATELLITE
     def write_map(self,  f):
-        f.write('\t\tvar centerlatlng = new google.maps.LatLng(%f, %f);\n' %
-                (self.center[0], self.center[1]))
-        f.write('\t\tvar myOptions = {\n')
-        f.write('\t\t\tzoom: %d,\n' % (self.zoom))
-        f.write('\t\t\tcenter: centerlatlng,\n')
-        f.write('\t\t\tmapTypeId: google.maps.MapTypeId.ROADMAP\n')
-        f.write('\t\t};\n')
-        f.write(
-            '\t\tvar map = new google.maps.Map(document.getElementById("map_canvas"), myOptions);\n')
-        f.write('\n')
+        f.write('\t\tvar centerlatlng = new google.maps.LatLng(%f, %f);\n'
+                '\t\tvar myOptions = {\n'
+                '\t\t\tzoom: %d,\n'
+                '\t\t\tcenter: centerlatlng,\n'
+                '\t\t\tmapTypeId: google.maps.MapTypeId.ROADMAP\n'
+                '\t\t};\n'
+                '\t\tvar map = new google.maps.Map(document.getElementById("map_canvas"), myOptions);\n'
+                '\n' % (self.center[0], self.center[1], self.zoom))
 
     def write_point(self, f, lat, lon, color, title):
-        f.write('\t\tvar latlng = new google.maps.LatLng(%f, %f);\n' %
-                (lat, lon))
         #f.write('\t\tvar img = new google.maps.MarkerImage(\'%s\');\n' %(self.coloricon % color))
-        f.write('\t\tvar marker = new google.maps.Marker({\n')
-        f.write('\t\ttitle: "%s",\n' % title)
         #f.write('\t\ticon: img,\n')
-        f.write('\t\tposition: latlng\n')
-        f.write('\t\t});\n')
-        f.write('\t\tmarker.setMap(map);\n')
-        f.write('\n')
+        f.write(MARKER_TEMPLATE % (lat, lon, title))
+
+    def write_compact_points(self, f):
+        if self.points:
+            titles = set(point[3] for point in self.points)
+            if len(titles) == 1:
+                titles_js = json.dumps(titles.pop())
+            else:
+                titles_js = json.dumps([point[3] for point in self.points])
+            f.write(COMPACT_MARKERS_TEMPLATE % (flat_array(self.points), titles_js))
+        for coords, color, title in self.marker_layers:
+            f.write(COMPACT_MARKERS_TEMPLATE % (flat_array(coords), json.dumps(title)))
+
+    def write_clustered_points(self, f):
+        coords = self.all_markers()
+        if not len(coords):
+            return
+        titles = set(point[3] for point in self.points)
+        titles.update(layer[2] for layer in self.marker_layers)
+        title = titles.pop() if len(titles) == 1 else ''
+
+        min_zoom, max_zoom, cell_pixels = self.clustering
+        levels = cluster_levels(coords, min_zoom, max_zoom, cell_pixels)
+        # counts as integers; %g would print 1234567 as 1.23457e+06
+        levels_js = '{' + ','.join(['"%d":%s' % (zoom, weighted_flat_array(centers, counts, '%d'))
+                                    for zoom, centers, counts in levels]) + '}'
+        zooms_js = json.dumps([level[0] for level in levels])
+        f.write(CLUSTERED_MARKERS_TEMPLATE % (levels_js, zooms_js, json.dumps(title)))
+
+    def coords_js(self, coords):
+        """JS expression for an array of LatLngs, in the plotter's output mode."""
+        return self.coords_head() + self.coords_chunk(coords) + self.coords_foot()
+
+    # coords_js split in three, so a layer can also be written a chunk at a time.
+
+    def coords_head(self):
+        return 'gmplot_latlngs([' if self.compact else '[\n'
+
+    def coords_chunk(self, coords, first=True):
+        if self.compact:
+            return flat_values(coords) if first else ',' + flat_values(coords)
+        return latlng_lines(coords)
+
+    def coords_foot(self):
+        return '])' if self.compact else ']'
 
     def write_polyline(self, f, path, settings):
+        f.write('var PolylineCoordinates = ' + self.coords_js(path) + self.polyline_tail(settings))
+
+    def polyline_tail(self, settings):
+        if self.compact and id(settings) in self.style_ids:
+            return (';\n'
+                    'new google.maps.Polyline(Object.assign({path: PolylineCoordinates, map: map}, '
+                    'gmplot_styles[%d].line));\n' % self.style_ids[id(settings)])
         clickable = False
         geodesic = True
         strokeColor = settings.get('color') or settings.get('edge_color')
         strokeOpacity = settings.get('edge_alpha')
         strokeWeight = settings.get('edge_width')
 
-        f.write('var PolylineCoordinates = [\n')
-        for coordinate in path:
-            f.write('new google.maps.LatLng(%f, %f),\n' %
-                    (coordinate[0], coordinate[1]))
-        f.write('];\n')
-        f.write('\n')
-
-        f.write('var Path = new google.maps.Polyline({\n')
-        f.write('clickable: %s,\n' % (str(clickable).lower()))
-        f.write('geodesic: %s,\n' % (str(geodesic).lower()))
-        f.write('path: PolylineCoordinates,\n')
-        f.write('strokeColor: "%s",\n' % (strokeColor))
-        f.write('strokeOpacity: %f,\n' % (strokeOpacity))
-        f.write('strokeWeight: %d\n' % (strokeWeight))
-        f.write('});\n')
-        f.write('\n')
-        f.write('Path.setMap(map);\n')
-        f.write('\n\n')
+        return (
+            ';\n'
+            '\n'
+            'var Path = new google.maps.Polyline({\n'
+            'clickable: %s,\n'
+            'geodesic: %s,\n'
+            'path: PolylineCoordinates,\n'
+            'strokeColor: "%s",\n'
+            'strokeOpacity: %f,\n'
+            'strokeWeight: %d\n'
+            '});\n'
+            '\n'
+            'Path.setMap(map);\n'
+            '\n\n' % (str(clickable).lower(), str(geodesic).lower(),
+                      strokeColor, strokeOpacity, strokeWeight))
 
     def write_polygon(self, f, path, settings):
+        f.write('var coords = ' + self.coords_js(path) + self.polygon_tail(settings))
+
+    def polygon_tail(self, settings):
+        if self.compact and id(settings) in self.style_ids:
+            return (';\n'
+                    'new google.maps.Polygon(Object.assign({paths: coords, map: map}, '
+                    'gmplot_styles[%d].shape));\n' % self.style_ids[id(settings)])
         clickable = False
         geodesic = True
         strokeColor = settings.get('edge_color') or settings.get('color')
@@ -364,54 +708,59 @@ class GoogleMapPlotter(object):
         strokeWeight = settings.get('edge_width')
         fillColor = settings.get('face_color') or settings.get('color')
         fillOpacity= settings.get('face_alpha')
-        f.write('var coords = [\n')
-        for coordinate in path:
-            f.write('new google.maps.LatLng(%f, %f),\n' %
-                    (coordinate[0], coordinate[1]))
-        f.write('];\n')
-        f.write('\n')
-
-        f.write('var polygon = new google.maps.Polygon({\n')
-        f.write('clickable: %s,\n' % (str(clickable).lower()))
-        f.write('geodesic: %s,\n' % (str(geodesic).lower()))
-        f.write('fillColor: "%s",\n' % (fillColor))
-        f.write('fillOpacity: %f,\n' % (fillOpacity))
-        f.write('paths: coords,\n')
-        f.write('strokeColor: "%s",\n' % (strokeColor))
-        f.write('strokeOpacity: %f,\n' % (strokeOpacity))
-        f.write('strokeWeight: %d\n' % (strokeWeight))
-        f.write('});\n')
-        f.write('\n')
-        f.write('polygon.setMap(map);\n')
-        f.write('\n\n')
+        return (
+            ';\n'
+            '\n'
+            'var polygon = new google.maps.Polygon({\n'
+            'clickable: %s,\n'
+            'geodesic: %s,\n'
+            'fillColor: "%s",\n'
+            'fillOpacity: %f,\n'
+            'paths: coords,\n'
+            'strokeColor: "%s",\n'
+            'strokeOpacity: %f,\n'
+            'strokeWeight: %d\n'
+            '});\n'
+            '\n'
+            'polygon.setMap(map);\n'
+            '\n\n' % (str(clickable).lower(), str(geodesic).lower(),
+                      fillColor, fillOpacity,
+                      strokeColor, strokeOpacity, strokeWeight))
 
     def write_heatmap(self, f):
-        for heatmap_points, settings_string in self.heatmap_points:
-            f.write('var heatmap_points = [\n')
-            for heatmap_lat, heatmap_lng in heatmap_points:
-                f.write('new google.maps.LatLng(%f, %f),\n' %
-                        (heatmap_lat, heatmap_lng))
-            f.write('];\n')
-            f.write('\n')
-            f.write('var pointArray = new google.maps.MVCArray(heatmap_points);' + '\n')
-            f.write('var heatmap;' + '\n')
-            f.write('heatmap = new google.maps.visualization.HeatmapLayer({' + '\n')
-            f.write('\n')
-            f.write('data: pointArray' + '\n')
-            f.write('});' + '\n')
-            f.write('heatmap.setMap(map);' + '\n')
-            f.write(settings_string)
+        for heatmap_points, settings_string, weights in self.heatmap_points:
+            if weights is None:
+                data_js = self.coords_js(heatmap_points)
+            elif self.compact:
+                data_js = 'gmplot_weighted(%s)' % weighted_flat_array(heatmap_points, weights)
+            else:
+                data_js = '[\n' + weighted_latlng_lines(heatmap_points, weights) + ']'
+            f.write('var heatmap_points = ' + data_js + self.heatmap_tail(settings_string))
+
+    def heatmap_tail(self, settings_string):
+        return (
+            ';\n'
+            '\n'
+            'var pointArray = new google.maps.MVCArray(heatmap_points);\n'
+            'var heatmap;\n'
+            'heatmap = new google.maps.visualization.HeatmapLayer({\n'
+            '\n'
+            'data: pointArray\n'
+            '});\n'
+            'heatmap.setMap(map);\n' +
+            settings_string)
 
     def write_ground_overlay(self, f):
 
         for url, bounds_string in self.ground_overlays:
-            f.write(bounds_string)
-            f.write('var groundOverlay;' + '\n')
-            f.write('groundOverlay = new google.maps.GroundOverlay(' + '\n')
-            f.write('\n')
-            f.write("'" + url + "'," + '\n')
-            f.write('imageBounds);' + '\n')
-            f.write('groundOverlay.setMap(map);' + '\n')
+            f.write(
+                bounds_string +
+                'var groundOverlay;\n'
+                'groundOverlay = new google.maps.GroundOverlay(\n'
+                '\n'
+                "'" + url + "',\n"
+                'imageBounds);\n'
+                'groundOverlay.setMap(map);\n')
 
 if __name__ == "__main__":
 
@@ -0,0 +1,71 @@
+# Columnar coordinate storage for gmplot layers.
+# Every layer keeps its latitudes and longitudes as two contiguous float64 arrays
+# instead of a list of (lat, lng) tuples, so ingestion, validation and formatting
+# all run over flat buffers.
+
+from array import array
+
+
+def as_column(values):
+    """Copy a sequence of numbers into a contiguous float64 array.
+
+    Contiguous float64 buffers (array('d'), NumPy float64 arrays, ...) are copied
+    in one block; anything else is converted element by element.
+    """
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return array('d', values)
+    if view.format == 'd' and view.ndim == 1 and view.c_contiguous:
+        column = array('d')
+        column.frombytes(view.cast('B'))
+        return column
+    return array('d', view.tolist())
+
+
+class Coords(object):
+    """A path, shape or point set stored as parallel lat/lng float64 columns.
+
+    Iterating yields (lat, lng) tuples, so a Coords can be used anywhere the
+    plotter used to accept a list of pairs.
+    """
+
+    __slots__ = ('lats', 'lngs')
+
+    def __init__(self, lats, lngs):
+        self.lats = as_column(lats)
+        self.lngs = as_column(lngs)
+        if len(self.lats) != len(self.lngs):
+            raise ValueError("got %d latitudes but %d longitudes" % (len(self.lats), len(self.lngs)))
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        if isinstance(pairs, cls):
+            return pairs
+        pairs = list(pairs)
+        return cls([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+
+    @classmethod
+    def concat(cls, parts):
+        """Join several Coords (or lists of pairs) into one."""
+        result = cls((), ())
+        for part in parts:
+            part = cls.from_pairs(part)
+            result.lats.extend(part.lats)
+            result.lngs.extend(part.lngs)
+        return result
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __iter__(self):
+        return zip(self.lats, self.lngs)
+
+    def __getitem__(self, i):
+        return self.lats[i], self.lngs[i]
+
+    def validate(self):
+        """Raise ValueError if any latitude lies outside [-90, 90]."""
+        if self.lats and (min(self.lats) < -90.0 or max(self.lats) > 90.0):
+            raise ValueError("latitudes must lie within [-90, 90]")
+        return self
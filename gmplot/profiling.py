@@ -0,0 +1,121 @@
+# Opt-in render instrumentation for GoogleMapPlotter.
+# Once gmap.profile() is called, every draw() times each write_* phase, counts
+# the bytes and coordinates it emitted, keeps the result as gmap.profiler.report
+# and passes it to an optional callback (e.g. to forward it to a metrics system).
+# With no profiler set, draw() takes the plain path and pays nothing.
+
+import time
+from collections import namedtuple
+
+# The sections of the page, in the order write_html emits them.
+PHASES = ('head', 'grids', 'points', 'paths', 'shapes', 'heatmap', 'ground_overlay', 'foot')
+
+PhaseStats = namedtuple('PhaseStats', 'phase seconds bytes coordinates layers')
+
+
+class CountingWriter(object):
+    """File wrapper counting the characters written through it (bytes, for gmplot's ascii output)."""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.f.write(data)
+
+
+class RenderReport(object):
+    """Per phase timings and sizes of one draw() call.
+
+    phases is a list of PhaseStats(phase, seconds, bytes, coordinates, layers),
+    where coordinates are the (lat, lng) pairs written and layers the number of
+    separate layers (marker layers, paths, heatmaps, ...) in that phase.
+    """
+
+    def __init__(self, phases, vertices_removed=0):
+        self.phases = phases
+        self.vertices_removed = vertices_removed
+
+    @property
+    def seconds(self):
+        return sum(stats.seconds for stats in self.phases)
+
+    @property
+    def bytes(self):
+        return sum(stats.bytes for stats in self.phases)
+
+    @property
+    def coordinates(self):
+        return sum(stats.coordinates for stats in self.phases)
+
+    def slowest(self):
+        return max(self.phases, key=lambda stats: stats.seconds)
+
+    def as_dict(self):
+        """Plain dict form, ready for json.dumps or a metrics client."""
+        return {
+            'seconds': self.seconds,
+            'bytes': self.bytes,
+            'coordinates': self.coordinates,
+            'vertices_removed': self.vertices_removed,
+            'phases': [stats._asdict() for stats in self.phases],
+        }
+
+    def __str__(self):
+        lines = ['%-15s %10s %12s %12s %8s' % ('phase', 'seconds', 'bytes', 'coordinates', 'layers')]
+        for stats in self.phases:
+            lines.append('%-15s %10.4f %12d %12d %8d' % stats)
+        lines.append('%-15s %10.4f %12d %12d' % ('total', self.seconds, self.bytes, self.coordinates))
+        if self.vertices_removed:
+            lines.append('simplification removed %d vertices' % self.vertices_removed)
+        return '\n'.join(lines)
+
+
+def phase_size(gmap, phase):
+    """(coordinates, layers) a plotter writes in a phase.
+
+    Layers a StreamingMapPlotter has already spooled to disk are not in memory
+    any more and count as zero; their bytes are still measured.
+    """
+    if phase == 'grids':
+        count = len(gmap.grids) if gmap.gridsetting is not None and gmap.grids is not None else 0
+        return count, int(count > 0)
+    if phase == 'points':
+        count = len(gmap.points) + sum(len(layer[0]) for layer in gmap.marker_layers)
+        return count, int(bool(gmap.points)) + len(gmap.marker_layers)
+    if phase in ('paths', 'shapes'):
+        features = getattr(gmap, phase)
+        return sum(len(coords) for coords, settings in features), len(features)
+    if phase == 'heatmap':
+        return sum(len(layer[0]) for layer in gmap.heatmap_points), len(gmap.heatmap_points)
+    if phase == 'ground_overlay':
+        return 0, len(gmap.ground_overlays)
+    return 0, 0
+
+
+class RenderProfiler(object):
+    """Times the phases of GoogleMapPlotter.write_html. Created by GoogleMapPlotter.profile()."""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.report = None
+
+    def write_html(self, gmap, f):
+        counter = CountingWriter(f)
+        clock = time.perf_counter
+        phases = []
+        gmap.vertices_removed = 0
+        for phase in PHASES:
+            removed = gmap.vertices_removed
+            written = counter.count
+            start = clock()
+            getattr(gmap, 'write_' + phase)(counter)
+            elapsed = clock() - start
+            coordinates, layers = phase_size(gmap, phase)
+            phases.append(PhaseStats(phase, elapsed, counter.count - written,
+                                     coordinates - (gmap.vertices_removed - removed), layers))
+        self.report = RenderReport(phases, gmap.vertices_removed)
+        if self.callback is not None:
+            self.callback(self.report)
+        return self.report
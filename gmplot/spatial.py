@@ -0,0 +1,95 @@
+# Static R-tree over lat/lng bounding boxes, used by GoogleMapPlotter to answer
+# bounding box and nearest neighbour queries without scanning every layer.
+# The tree is bulk loaded with Sort-Tile-Recursive packing, so it is built in
+# O(n log n) and every node except the last in each level is full.
+
+import heapq
+import math
+
+NODE_SIZE = 16
+
+
+class RTree(object):
+    """R-tree over (south, north, west, east) boxes, each carrying an item.
+
+    Points are boxes with south == north and west == east.
+    Example use:
+    tree = RTree([(lat, lat, lng, lng) for lat, lng in points], range(len(points)))
+    tree.search(41.8, 41.9, -87.7, -87.6)
+    """
+
+    def __init__(self, boxes, items, node_size=NODE_SIZE):
+        self.node_size = node_size
+        level = [(box, True, item) for box, item in zip(boxes, items)]
+        self.size = len(level)
+        while len(level) > node_size:
+            level = self._pack(level)
+        self.root = (self._cover(level), False, level) if level else None
+
+    def __len__(self):
+        return self.size
+
+    def _pack(self, entries):
+        """Group entries into parent nodes: slice by longitude, then run by latitude in each slice."""
+        size = self.node_size
+        node_count = int(math.ceil(len(entries) / float(size)))
+        slice_count = int(math.ceil(math.sqrt(node_count)))
+        per_slice = slice_count * size
+        entries = sorted(entries, key=lambda e: e[0][2] + e[0][3])
+        parents = []
+        for start in range(0, len(entries), per_slice):
+            column = sorted(entries[start:start + per_slice], key=lambda e: e[0][0] + e[0][1])
+            for i in range(0, len(column), size):
+                children = column[i:i + size]
+                parents.append((self._cover(children), False, children))
+        return parents
+
+    @staticmethod
+    def _cover(entries):
+        return (min(e[0][0] for e in entries), max(e[0][1] for e in entries),
+                min(e[0][2] for e in entries), max(e[0][3] for e in entries))
+
+    def search(self, south, north, west, east):
+        """Items whose boxes intersect the query box."""
+        found = []
+        if self.root is None:
+            return found
+        stack = [self.root]
+        while stack:
+            box, leaf, payload = stack.pop()
+            if box[0] > north or box[1] < south or box[2] > east or box[3] < west:
+                continue
+            if leaf:
+                found.append(payload)
+            else:
+                stack.extend(payload)
+        return found
+
+    def nearest(self, lat, lng, k=1):
+        """The k items closest to (lat, lng), nearest first, as (distance in degrees, item) pairs.
+
+        Best-first search: nodes are expanded in order of the distance to
+        their box, so only the branches that can still hold a closer item are
+        visited. Longitudes are scaled by cos(lat) so distances are isotropic.
+        """
+        if self.root is None:
+            return []
+        scale = math.cos(math.radians(lat))
+
+        def distance_sq(box):
+            dlat = max(box[0] - lat, 0.0, lat - box[1])
+            dlng = max(box[2] - lng, 0.0, lng - box[3]) * scale
+            return dlat * dlat + dlng * dlng
+
+        results = []
+        counter = 0
+        heap = [(distance_sq(self.root[0]), counter, self.root)]
+        while heap and len(results) < k:
+            dist, _, (box, leaf, payload) = heapq.heappop(heap)
+            if leaf:
+                results.append((math.sqrt(dist), payload))
+                continue
+            for child in payload:
+                counter += 1
+                heapq.heappush(heap, (distance_sq(child[0]), counter, child))
+        return results
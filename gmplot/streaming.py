@@ -0,0 +1,165 @@
+# Streaming variant of GoogleMapPlotter for maps too large to hold in memory.
+# Layers are rendered chunk by chunk as their data arrives and spooled to
+# temporary files, one per section of the page; draw() stitches the sections
+# together in the same order GoogleMapPlotter uses, so the two produce
+# identical html for the same calls.
+
+import csv
+import json
+import shutil
+import tempfile
+from itertools import chain, islice
+
+from .geometry import DEFAULT_SEGMENTS, circles
+from .gmplot import (COMPACT_MARKERS_HEAD, COMPACT_MARKERS_TAIL, MARKER_TEMPLATE, WRITE_BUFFER_SIZE,
+                     GoogleMapPlotter, flat_values)
+from .layers import Coords
+
+DEFAULT_CHUNK_SIZE = 10000
+
+SECTIONS = ('points', 'paths', 'shapes', 'heatmap')
+
+
+def read_csv_points(f, lat_column='lat', lng_column='lng'):
+    """Lazily yield (lat, lng) pairs from an open csv file with a header row."""
+    for row in csv.DictReader(f):
+        yield float(row[lat_column]), float(row[lng_column])
+
+
+class StreamingMapPlotter(GoogleMapPlotter):
+    """GoogleMapPlotter whose scatter/plot/polygon/heatmap layers are written out as they arrive.
+
+    Every layer method accepts either two iterables (lats, lngs) or one iterable
+    of (lat, lng) pairs as `lats` with lngs=None, e.g. a generator over a csv
+    reader (see read_csv_points). Input is consumed chunk_size points at a time,
+    so peak memory does not grow with the number of points.
+
+    Single markers, grids and ground overlays are small and stay in memory.
+    Marker clustering and path simplification need whole layers and are not
+    available here.
+
+    Example use:
+    with StreamingMapPlotter('stores.html', 41.88, -87.63, 11) as gmap:
+        with open('stores.csv') as f:
+            gmap.scatter(read_csv_points(f))
+    """
+
+    def __init__(self, htmlfile, center_lat, center_lng, zoom, apikey='', compact=False,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        GoogleMapPlotter.__init__(self, center_lat, center_lng, zoom, apikey, compact)
+        self.htmlfile = htmlfile
+        self.chunk_size = int(chunk_size)
+        self.spools = dict((name, tempfile.TemporaryFile('w+')) for name in SECTIONS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.draw()
+        self.close()
+
+    def close(self):
+        for spool in self.spools.values():
+            spool.close()
+
+    def chunks(self, lats, lngs=None):
+        """Validated Coords of at most chunk_size points each."""
+        pairs = iter(lats) if lngs is None else zip(lats, lngs)
+        while True:
+            chunk = list(islice(pairs, self.chunk_size))
+            if not chunk:
+                return
+            yield Coords.from_pairs(chunk).validate()
+
+    def cluster_markers(self, min_zoom=0, max_zoom=None, cell_pixels=60):
+        raise ValueError("marker clustering needs every marker in memory; use GoogleMapPlotter")
+
+    def scatter(self, lats, lngs=None, color=None, size=None, marker=True, c=None, s=None,
+                segments=DEFAULT_SEGMENTS, **kwargs):
+        color = color or c
+        size = size or s or 40
+        kwargs["color"] = color
+        kwargs["size"] = size
+        settings = self._process_kwargs(kwargs)
+        title = "no implementation"
+        if not marker:
+            for coords in self.chunks(lats, lngs):
+                for cycle in circles(coords.lats, coords.lngs, size, segments):
+                    self.write_polygon(self.spools['shapes'], cycle, settings)
+            return
+
+        f = self.spools['points']
+        if not self.compact:
+            for coords in self.chunks(lats, lngs):
+                f.write(''.join([MARKER_TEMPLATE % (lat, lng, title) for lat, lng in coords]))
+            return
+        f.write(COMPACT_MARKERS_HEAD + '[')
+        for i, coords in enumerate(self.chunks(lats, lngs)):
+            f.write(flat_values(coords) if i == 0 else ',' + flat_values(coords))
+        f.write("]" + COMPACT_MARKERS_TAIL % json.dumps(title))
+
+    def circle(self, lat, lng, radius, color=None, c=None, segments=DEFAULT_SEGMENTS, **kwargs):
+        GoogleMapPlotter.circle(self, lat, lng, radius, color, c, segments, **kwargs)
+        for path, settings in self.shapes:
+            self.write_polygon(self.spools['shapes'], path, settings)
+        del self.shapes[:]
+
+    def plot(self, lats, lngs=None, color=None, c=None, **kwargs):
+        color = color or c
+        kwargs.setdefault("color", color)
+        settings = self._process_kwargs(kwargs)
+        self.write_chunked(self.spools['paths'], 'var PolylineCoordinates = ',
+                           self.chunks(lats, lngs), self.polyline_tail(settings))
+
+    def polygon(self, lats, lngs=None, color=None, c=None, **kwargs):
+        color = color or c
+        kwargs.setdefault("color", color)
+        settings = self._process_kwargs(kwargs)
+        self.write_chunked(self.spools['shapes'], 'var coords = ',
+                           self.chunks(lats, lngs), self.polygon_tail(settings))
+
+    def heatmap(self, lats, lngs=None, threshold=10, radius=10, gradient=None, opacity=0.6, maxIntensity=1,
+                dissipating=True, aggregate=None):
+        settings = self._heatmap_settings(threshold, radius, gradient, opacity, maxIntensity, dissipating)
+        f = self.spools['heatmap']
+        if aggregate:
+            # Binning keeps one accumulator per cell, so memory stays bounded by the number of cells.
+            points = chain.from_iterable(self.chunks(lats, lngs))
+            heatmap_points, weights = self._heatmap_data(points, radius, aggregate)
+            self.heatmap_points.append((heatmap_points, settings, weights))
+            GoogleMapPlotter.write_heatmap(self, f)
+            del self.heatmap_points[:]
+            return
+        self.write_chunked(f, 'var heatmap_points = ', self.chunks(lats, lngs), self.heatmap_tail(settings))
+
+    def write_chunked(self, f, head, chunks, tail):
+        f.write(head + self.coords_head())
+        for i, coords in enumerate(chunks):
+            f.write(self.coords_chunk(coords, i == 0))
+        f.write(self.coords_foot() + tail)
+
+    def draw(self, htmlfile=None):
+        """Write the finished map to htmlfile, or by default the file given to the constructor."""
+        with open(htmlfile or self.htmlfile, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+            self.write_html(f)
+
+    def copy_spool(self, name, f):
+        spool = self.spools[name]
+        spool.flush()
+        spool.seek(0)
+        shutil.copyfileobj(spool, f, WRITE_BUFFER_SIZE)
+        spool.seek(0, 2)
+
+    def write_points(self, f):
+        GoogleMapPlotter.write_points(self, f)
+        self.copy_spool('points', f)
+
+    def write_paths(self, f):
+        self.copy_spool('paths', f)
+
+    def write_shapes(self, f):
+        self.copy_spool('shapes', f)
+
+    def write_heatmap(self, f):
+        self.copy_spool('heatmap', f)
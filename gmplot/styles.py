@@ -0,0 +1,95 @@
+# Memoized style resolution for gmplot.
+# Identical style keyword combinations resolve to one shared, read-only
+# settings mapping, so repeated marker/circle/plot/polygon calls with the same
+# style cost a single dict lookup, and compact output can declare each style
+# once and refer to it by index.
+
+from types import MappingProxyType
+
+from .color_dicts import color_table
+
+STYLE_KEYS = ('color', 'c', 'edge_color', 'ec', 'alpha', 'edge_alpha', 'ea',
+              'edge_width', 'ew', 'face_alpha', 'fa', 'face_color', 'fc', 'closed')
+
+_styles = {}
+
+
+def resolve_style(kwargs):
+    """Shared read-only settings for a set of style keyword arguments."""
+    key = tuple([kwargs.get(name, None) for name in STYLE_KEYS])
+    try:
+        return _styles[key]
+    except KeyError:
+        style = _styles[key] = MappingProxyType(build_style(kwargs))
+        return style
+    except TypeError:
+        # Unhashable values (e.g. a color given as a list) can't be cached.
+        return MappingProxyType(build_style(kwargs))
+
+
+def build_style(kwargs):
+    settings = dict()
+    settings["edge_color"] = kwargs.get("color", None) or \
+                             kwargs.get("edge_color", None) or \
+                             kwargs.get("ec", None) or \
+                             "#000000"
+
+    settings["edge_alpha"] = kwargs.get("alpha", None) or \
+                             kwargs.get("edge_alpha", None) or \
+                             kwargs.get("ea", None) or \
+                             1.0
+    settings["edge_width"] = kwargs.get("edge_width", None) or \
+                             kwargs.get("ew", None) or \
+                             1.0
+    settings["face_alpha"] = kwargs.get("alpha", None) or \
+                             kwargs.get("face_alpha", None) or \
+                             kwargs.get("fa", None) or \
+                             0.3
+    settings["face_color"] = kwargs.get("color", None) or \
+                             kwargs.get("face_color", None) or \
+                             kwargs.get("fc", None) or \
+                             "#000000"
+
+    settings["color"] = kwargs.get("color", None) or \
+                        kwargs.get("c", None) or \
+                        settings["edge_color"] or \
+                        settings["face_color"]
+
+    # Need to replace "plum" with "#DDA0DD" and "c" with "#00FFFF" (cyan).
+    for key in ("edge_color", "face_color", "color"):
+        settings[key] = color_table.get(settings[key], settings[key])
+
+    settings["closed"] = kwargs.get("closed", None)
+
+    return settings
+
+
+def style_js(settings):
+    """JS object literal holding the Polyline ('line') and Polygon ('shape') options of a style."""
+    line = (
+        '{clickable: false, geodesic: true, strokeColor: "%s", strokeOpacity: %f, strokeWeight: %d}' %
+        (settings.get('color') or settings.get('edge_color'), settings.get('edge_alpha'),
+         settings.get('edge_width')))
+    shape = (
+        '{clickable: false, geodesic: true, fillColor: "%s", fillOpacity: %f, '
+        'strokeColor: "%s", strokeOpacity: %f, strokeWeight: %d}' %
+        (settings.get('face_color') or settings.get('color'), settings.get('face_alpha'),
+         settings.get('edge_color') or settings.get('color'), settings.get('edge_alpha'),
+         settings.get('edge_width')))
+    return '{line: %s, shape: %s}' % (line, shape)
+
+
+def style_options(settings):
+    """The Polyline ('line') and Polygon ('shape') options of a style as plain dicts, for JSON output."""
+    return {
+        'line': {'clickable': False, 'geodesic': True,
+                 'strokeColor': settings.get('color') or settings.get('edge_color'),
+                 'strokeOpacity': settings.get('edge_alpha'),
+                 'strokeWeight': settings.get('edge_width')},
+        'shape': {'clickable': False, 'geodesic': True,
+                  'fillColor': settings.get('face_color') or settings.get('color'),
+                  'fillOpacity': settings.get('face_alpha'),
+                  'strokeColor': settings.get('edge_color') or settings.get('color'),
+                  'strokeOpacity': settings.get('edge_alpha'),
+                  'strokeWeight': settings.get('edge_width')},
+    }
@@ -0,0 +1,311 @@
+# Tiled export for very large gmplot maps.
+# Instead of one html file with every layer inlined, export_tiles writes
+#   index.html          - the map page, which fetches only the tiles in view
+#   manifest.json       - map settings, shared styles and a content hash per tile
+#   tiles/<z>/<x>/<y>.json - the markers, heatmap points, and the pieces of paths
+#                            and shapes clipped to one slippy-map tile
+# The layers are partitioned (and simplified) in chunks by a process pool, tiles
+# are serialized in parallel, and a tile file is only rewritten when its hash
+# differs from the one in the previous manifest.
+# The page loads tiles with fetch(), so serve the directory over http
+# (e.g. python -m http.server) rather than opening index.html as a file.
+
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .geometry import simplify, zoom_tolerance
+from .gmplot import COMPACT_HELPERS
+from .layers import Coords
+from .styles import style_options
+from .tiling import clip_ring, latlng_to_tile, path_tile_pieces, tile_bounds, tiles_covering
+
+MANIFEST_NAME = 'manifest.json'
+
+# Points (markers, heatmap points or path/shape vertices) per partitioning job.
+CHUNK_SIZE = 50000
+
+TILE_LOADER_TEMPLATE = (
+    '\t\tvar gmplot_manifest = %s;\n'
+    '\t\tvar gmplot_loaded = {};\n'
+    '\t\tvar heatmap_data = new google.maps.MVCArray();\n'
+    '\t\tvar heatmap = new google.maps.visualization.HeatmapLayer({data: heatmap_data, map: map});\n'
+    '%s'
+    '\t\tfunction gmplot_add_tile(tile) {\n'
+    '\t\t\tfor (var i = 0; i < tile.markers.length; i += 2) {\n'
+    '\t\t\t\tnew google.maps.Marker({position: new google.maps.LatLng(tile.markers[i], tile.markers[i + 1]),\n'
+    '\t\t\t\t\ttitle: gmplot_manifest.title, map: map});\n'
+    '\t\t\t}\n'
+    '\t\t\tfor (var i = 0; i < tile.heatmap.length; i += 3) {\n'
+    '\t\t\t\theatmap_data.push({location: new google.maps.LatLng(tile.heatmap[i], tile.heatmap[i + 1]),\n'
+    '\t\t\t\t\tweight: tile.heatmap[i + 2]});\n'
+    '\t\t\t}\n'
+    '\t\t\t// Each tile holds only the pieces of paths and shapes inside it.\n'
+    '\t\t\ttile.paths.forEach(function (path) {\n'
+    '\t\t\t\tnew google.maps.Polyline(Object.assign({path: gmplot_latlngs(path[1]), map: map},\n'
+    '\t\t\t\t\tgmplot_manifest.styles[path[0]].line));\n'
+    '\t\t\t});\n'
+    '\t\t\ttile.shapes.forEach(function (shape) {\n'
+    '\t\t\t\tnew google.maps.Polygon(Object.assign({paths: gmplot_latlngs(shape[1]), map: map},\n'
+    '\t\t\t\t\tgmplot_manifest.styles[shape[0]].shape));\n'
+    '\t\t\t});\n'
+    '\t\t\ttile.fills.forEach(function (fill) {\n'
+    '\t\t\t\tnew google.maps.Polygon(Object.assign({paths: gmplot_latlngs(fill[1]), map: map},\n'
+    '\t\t\t\t\tgmplot_manifest.styles[fill[0]].shape, {strokeWeight: 0}));\n'
+    '\t\t\t});\n'
+    '\t\t\ttile.outlines.forEach(function (outline) {\n'
+    '\t\t\t\tvar shape = gmplot_manifest.styles[outline[0]].shape;\n'
+    '\t\t\t\tnew google.maps.Polyline({path: gmplot_latlngs(outline[1]), map: map, clickable: false,\n'
+    '\t\t\t\t\tgeodesic: true, strokeColor: shape.strokeColor, strokeOpacity: shape.strokeOpacity,\n'
+    '\t\t\t\t\tstrokeWeight: shape.strokeWeight});\n'
+    '\t\t\t});\n'
+    '\t\t}\n'
+    '\t\tfunction gmplot_tile_xy(lat, lng, n) {\n'
+    '\t\t\tlat = Math.max(Math.min(lat, 85.0511287798), -85.0511287798);\n'
+    '\t\t\tvar s = Math.sin(lat * Math.PI / 180);\n'
+    '\t\t\tvar x = Math.floor((lng + 180) / 360 * n);\n'
+    '\t\t\tvar y = Math.floor((0.5 - Math.log((1 + s) / (1 - s)) / (4 * Math.PI)) * n);\n'
+    '\t\t\treturn [Math.min(Math.max(x, 0), n - 1), Math.min(Math.max(y, 0), n - 1)];\n'
+    '\t\t}\n'
+    '\t\tfunction gmplot_load_visible() {\n'
+    '\t\t\tvar bounds = map.getBounds();\n'
+    '\t\t\tif (!bounds) return;\n'
+    '\t\t\tvar z = gmplot_manifest.zoom, n = Math.pow(2, z);\n'
+    '\t\t\tvar ne = bounds.getNorthEast(), sw = bounds.getSouthWest();\n'
+    '\t\t\tvar lo = gmplot_tile_xy(ne.lat(), sw.lng(), n), hi = gmplot_tile_xy(sw.lat(), ne.lng(), n);\n'
+    '\t\t\tfor (var x = lo[0]; x <= hi[0]; x++) {\n'
+    '\t\t\t\tfor (var y = lo[1]; y <= hi[1]; y++) {\n'
+    '\t\t\t\t\tvar key = z + "/" + x + "/" + y;\n'
+    '\t\t\t\t\tif (gmplot_loaded[key] || !(key in gmplot_manifest.tiles)) continue;\n'
+    '\t\t\t\t\tgmplot_loaded[key] = true;\n'
+    '\t\t\t\t\tfetch("tiles/" + key + ".json").then(function (r) { return r.json(); }).then(gmplot_add_tile);\n'
+    '\t\t\t\t}\n'
+    '\t\t\t}\n'
+    '\t\t}\n'
+    '\t\tmap.addListener("idle", gmplot_load_visible);\n'
+    '\n')
+
+
+def empty_tile():
+    return {'markers': [], 'heatmap': [], 'paths': [], 'shapes': [], 'fills': [], 'outlines': []}
+
+
+def partition_chunk(job):
+    """{(x, y): tile dict} for one chunk of a map's layers, and the vertices simplification removed.
+
+    Points go to the tile containing them. A path is cut into the pieces
+    crossing each tile. A shape inside a single tile is kept whole; a larger
+    one is clipped to each tile it overlaps ('fills', drawn without a stroke)
+    and its outline is cut like a path ('outlines').
+    """
+    zoom, tolerance, markers, heatmap, features = job
+    tiles = {}
+    removed = 0
+
+    def tile(key):
+        entry = tiles.get(key)
+        if entry is None:
+            entry = tiles[key] = empty_tile()
+        return entry
+
+    lats, lngs = markers
+    for lat, lng in zip(lats, lngs):
+        tile(latlng_to_tile(lat, lng, zoom))['markers'].extend((lat, lng))
+
+    lats, lngs, weights = heatmap
+    for lat, lng, weight in zip(lats, lngs, weights):
+        tile(latlng_to_tile(lat, lng, zoom))['heatmap'].extend((lat, lng, weight))
+
+    for layer, style, lats, lngs in features:
+        coords = Coords(lats, lngs)
+        minimum = 2 if layer == 'paths' else 3
+        if tolerance:
+            simplified, dropped = simplify(coords, tolerance)
+            if len(simplified) >= minimum:
+                coords = simplified
+                removed += dropped
+        lats, lngs = coords.lats, coords.lngs
+        keys = tiles_covering(min(lats), max(lats), min(lngs), max(lngs), zoom)
+        if len(keys) == 1:
+            tile(keys[0])[layer].append([style, interleave(lats, lngs)])
+            continue
+        if layer == 'shapes':
+            for key in keys:
+                clipped_lats, clipped_lngs = clip_ring(lats, lngs, *tile_bounds(zoom, key[0], key[1]))
+                if len(clipped_lats) >= 3:
+                    tile(key)['fills'].append([style, interleave(clipped_lats, clipped_lngs)])
+            # the outline is the closed ring, cut like a path
+            lats = lats + lats[:1]
+            lngs = lngs + lngs[:1]
+        target = 'paths' if layer == 'paths' else 'outlines'
+        for key, ranges in path_tile_pieces(lats, lngs, zoom).items():
+            for first, stop in ranges:
+                tile(key)[target].append([style, interleave(lats[first:stop], lngs[first:stop])])
+    return tiles, removed
+
+
+def interleave(lats, lngs):
+    # [lat0, lng0, lat1, lng1, ...], the packed form gmplot_latlngs reads
+    flat = [0.0] * (2 * len(lats))
+    flat[0::2] = lats
+    flat[1::2] = lngs
+    return flat
+
+
+def partition_jobs(gmap, zoom, chunk_size=CHUNK_SIZE):
+    """partition_chunk jobs covering every marker, heatmap point, path and shape, about chunk_size points each."""
+    tolerance = zoom_tolerance(gmap.zoom, gmap.center[0], gmap.simplify_pixels) if gmap.simplify_pixels else None
+    nothing = ((), ())
+    markers = gmap.all_markers()
+    for i in range(0, len(markers), chunk_size):
+        yield zoom, tolerance, (markers.lats[i:i + chunk_size], markers.lngs[i:i + chunk_size]), nothing + ((),), []
+
+    for heatmap_points, settings_string, weights in gmap.heatmap_points:
+        heatmap_points = Coords.from_pairs(heatmap_points)
+        if weights is None:
+            weights = [1] * len(heatmap_points)
+        for i in range(0, len(heatmap_points), chunk_size):
+            yield zoom, tolerance, nothing, (heatmap_points.lats[i:i + chunk_size],
+                                             heatmap_points.lngs[i:i + chunk_size], weights[i:i + chunk_size]), []
+
+    features = []
+    size = 0
+    for layer, layer_features in (('paths', gmap.paths), ('shapes', gmap.shapes)):
+        for coords, settings in layer_features:
+            coords = Coords.from_pairs(coords)
+            if not len(coords):
+                continue
+            features.append((layer, gmap.style_ids[id(settings)], coords.lats, coords.lngs))
+            size += len(coords)
+            if size >= chunk_size:
+                yield zoom, tolerance, nothing, nothing + ((),), features
+                features = []
+                size = 0
+    if features:
+        yield zoom, tolerance, nothing, nothing + ((),), features
+
+
+def partition(gmap, zoom, pool=None):
+    """Split a plotter's layers into {(x, y): tile dict} at a tile zoom level, in `pool` if one is given.
+
+    Sets gmap.vertices_removed to the number of vertices simplification dropped, as draw() does.
+    """
+    jobs = partition_jobs(gmap, zoom)
+    results = pool.map(partition_chunk, jobs) if pool is not None else map(partition_chunk, jobs)
+    tiles = {}
+    gmap.vertices_removed = 0
+    for chunk, removed in results:
+        gmap.vertices_removed += removed
+        for key, content in chunk.items():
+            entry = tiles.get(key)
+            if entry is None:
+                tiles[key] = content
+            else:
+                for layer, values in content.items():
+                    entry[layer].extend(values)
+    return tiles
+
+
+def build_tile(job):
+    """Serialize one tile to JSON and write it to its path, unless its sha1 matches the previous export.
+
+    :return: (sha1 hex digest, whether the file was written)
+    """
+    path, content, previous_hash = job
+    data = json.dumps(content, separators=(',', ':'))
+    digest = hashlib.sha1(data.encode('utf-8')).hexdigest()
+    if digest != previous_hash or not os.path.exists(path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(data)
+        return digest, True
+    return digest, False
+
+
+def export_tiles(gmap, directory, zoom=None, processes=None):
+    """Write a GoogleMapPlotter's layers as a lazily loaded, tiled map in `directory`.
+
+    :param zoom: slippy-map zoom level of the data tiles (default: the map's zoom)
+    :param processes: worker processes used to partition the layers and write the tiles
+    (default: one per cpu); 0 does everything in this process
+    :return: dict with the number of tiles 'written', 'unchanged' and 'removed'
+    """
+    zoom = gmap.zoom if zoom is None else int(zoom)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    old_tiles = {}
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            old_manifest = json.load(f)
+        old_tiles = old_manifest.get('tiles', {})
+        # tile hashes can only be reused at the same zoom; at another zoom every old tile is stale
+        if old_manifest.get('zoom') == zoom:
+            previous = old_tiles
+
+    def tile_jobs(tiles):
+        keys = ['%d/%d/%d' % (zoom, x, y) for x, y in tiles]
+        jobs = [(os.path.join(directory, 'tiles', key + '.json'), tiles[xy], previous.get(key))
+                for key, xy in zip(keys, tiles)]
+        return keys, jobs
+
+    if processes == 0:
+        keys, jobs = tile_jobs(partition(gmap, zoom))
+        results = [build_tile(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            keys, jobs = tile_jobs(partition(gmap, zoom, pool))
+            results = list(pool.map(build_tile, jobs, chunksize=max(1, len(jobs) // 64)))
+
+    hashes = dict((key, digest) for key, (digest, written) in zip(keys, results))
+    stale = [key for key in old_tiles if key not in hashes]
+    tiles_directory = os.path.join(directory, 'tiles')
+    for key in stale:
+        path = os.path.join(tiles_directory, key + '.json')
+        if os.path.exists(path):
+            os.remove(path)
+        # drop the tiles/<z>/<x> and tiles/<z> directories once they are empty
+        parent = os.path.dirname(path)
+        while parent != tiles_directory and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    titles = set(point[3] for point in gmap.points)
+    titles.update(layer[2] for layer in gmap.marker_layers)
+    manifest = {
+        'zoom': zoom,
+        'title': titles.pop() if len(titles) == 1 else '',
+        'styles': [style_options(style) for style in gmap.styles],
+        'tiles': hashes,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'), sort_keys=True)
+    with open(os.path.join(directory, 'index.html'), 'w') as f:
+        f.write(index_html(gmap, manifest))
+
+    written = sum(1 for digest, was_written in results if was_written)
+    return {'written': written, 'unchanged': len(results) - written, 'removed': len(stale)}
+
+
+def index_html(gmap, manifest):
+    """The map page: base map, grids and overlays inline, data layers loaded per tile.
+
+    All heatmap layers share one HeatmapLayer on the page, using the first layer's settings.
+    """
+    heatmap_settings = gmap.heatmap_points[0][1] if gmap.heatmap_points else ''
+    heatmap_settings = ''.join(['\t\t' + line + '\n' for line in heatmap_settings.splitlines()])
+    f = io.StringIO()
+    gmap.write_head(f)
+    if not gmap.compact:
+        f.write(COMPACT_HELPERS)
+    gmap.write_grids(f)
+    gmap.write_ground_overlay(f)
+    f.write(TILE_LOADER_TEMPLATE % (json.dumps(manifest, separators=(',', ':'), sort_keys=True),
+                                    heatmap_settings))
+    gmap.write_foot(f)
+    return f.getvalue()
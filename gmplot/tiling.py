@@ -0,0 +1,224 @@
+# Map resolution helpers for gmplot: zoom-level scales, grid binning and geohashes.
+
+import math
+from array import array
+
+from .layers import Coords
+
+TILE_SIZE = 256
+
+
+def degrees_per_pixel(zoom):
+    """Width of one screen pixel in degrees of longitude at a Google Maps zoom level."""
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def bin_points(coords, cell, weights=None):
+    """Aggregate points into square grid cells `cell` degrees wide.
+
+    Returns (Coords of cell centroids, array of point counts). Using the
+    centroid of each cell rather than its corner keeps the result visually
+    close to the raw points.
+
+    If `weights` is given, each point counts that many times; this lets
+    already-binned points be binned again into coarser cells.
+    """
+    floor = math.floor
+    cells = {}
+    if weights is not None:
+        for (lat, lng), weight in zip(coords, weights):
+            key = (floor(lat / cell), floor(lng / cell))
+            acc = cells.get(key)
+            if acc is None:
+                cells[key] = [weight, lat * weight, lng * weight]
+            else:
+                acc[0] += weight
+                acc[1] += lat * weight
+                acc[2] += lng * weight
+        return _centroids(cells.values())
+    for lat, lng in coords:
+        key = (floor(lat / cell), floor(lng / cell))
+        acc = cells.get(key)
+        if acc is None:
+            cells[key] = [1, lat, lng]
+        else:
+            acc[0] += 1
+            acc[1] += lat
+            acc[2] += lng
+    return _centroids(cells.values())
+
+
+def geohash_bits(precision):
+    """(latitude bits, longitude bits) in a geohash of the given length."""
+    total = 5 * precision
+    return total // 2, (total + 1) // 2
+
+
+def geohash_precision(cell):
+    """Geohash length whose cells are closest in width to `cell` degrees."""
+    def distance(precision):
+        return abs(math.log(360.0 / 2 ** geohash_bits(precision)[1] / cell))
+    return min(range(1, 13), key=distance)
+
+
+def bin_geohash(coords, precision):
+    """Aggregate points by geohash cell. Returns (Coords of cell centroids, array of counts).
+
+    A geohash cell is just a (lat, lng) bucket on a power-of-two grid, so points
+    are bucketed by integer quantization; no hash strings are built.
+    """
+    lat_bits, lng_bits = geohash_bits(precision)
+    lat_scale = 2 ** lat_bits / 180.0
+    lng_scale = 2 ** lng_bits / 360.0
+    cells = {}
+    for lat, lng in coords:
+        key = (int((lat + 90.0) * lat_scale), int((lng + 180.0) * lng_scale))
+        acc = cells.get(key)
+        if acc is None:
+            cells[key] = [1, lat, lng]
+        else:
+            acc[0] += 1
+            acc[1] += lat
+            acc[2] += lng
+    return _centroids(cells.values())
+
+
+def _centroids(cells):
+    counts = array('d')
+    lats = array('d')
+    lngs = array('d')
+    for count, lat_sum, lng_sum in cells:
+        counts.append(count)
+        lats.append(lat_sum / count)
+        lngs.append(lng_sum / count)
+    return Coords(lats, lngs), counts
+
+
+def latlng_to_tile(lat, lng, zoom):
+    """(x, y) of the slippy-map (web mercator) tile containing a point."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_lat(zoom, y):
+    """Latitude of the northern edge of slippy-map tile row y."""
+    return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y / 2 ** zoom))))
+
+
+def tile_bounds(zoom, x, y):
+    """(south, north, west, east) of a slippy-map tile."""
+    n = 2 ** zoom
+    return tile_lat(zoom, y + 1), tile_lat(zoom, y), x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+
+
+def tiles_covering(south, north, west, east, zoom):
+    """Every (x, y) tile at `zoom` overlapping a lat/lng bounding box."""
+    x0, y0 = latlng_to_tile(north, west, zoom)
+    x1, y1 = latlng_to_tile(south, east, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def path_tile_pieces(lats, lngs, zoom):
+    """Split a path into {(x, y): [(start, stop), ...]} vertex ranges, one list per tile it crosses.
+
+    Each segment goes to every tile its bounding box overlaps, and runs of
+    consecutive segments in a tile become one range, so lats[start:stop] is a
+    piece of the path to draw in that tile. A piece may reach one vertex past
+    the tile's edge.
+    """
+    pieces = {}
+    if len(lats) < 2:
+        if len(lats):
+            pieces[latlng_to_tile(lats[0], lngs[0], zoom)] = [(0, 1)]
+        return pieces
+    previous = latlng_to_tile(lats[0], lngs[0], zoom)
+    for i in range(1, len(lats)):
+        current = latlng_to_tile(lats[i], lngs[i], zoom)
+        if current == previous:
+            keys = (current,)
+        else:
+            keys = tiles_covering(min(lats[i - 1], lats[i]), max(lats[i - 1], lats[i]),
+                                  min(lngs[i - 1], lngs[i]), max(lngs[i - 1], lngs[i]), zoom)
+        for key in keys:
+            ranges = pieces.setdefault(key, [])
+            # extend the tile's last range if this segment continues it
+            if ranges and ranges[-1][1] == i:
+                ranges[-1] = (ranges[-1][0], i + 1)
+            else:
+                ranges.append((i - 1, i + 1))
+        previous = current
+    return pieces
+
+
+def clip_ring(lats, lngs, south, north, west, east):
+    """Sutherland-Hodgman clip of a closed polygon ring to a lat/lng box; (lats, lngs) of the clipped ring."""
+    points = list(zip(lats, lngs))
+
+    def clip(points, inside, cross):
+        result = []
+        for i, current in enumerate(points):
+            before = points[i - 1]
+            if inside(current):
+                if not inside(before):
+                    result.append(cross(before, current))
+                result.append(current)
+            elif inside(before):
+                result.append(cross(before, current))
+        return result
+
+    def at_lat(lat):
+        return lambda a, b: (lat, a[1] + (b[1] - a[1]) * (lat - a[0]) / (b[0] - a[0]))
+
+    def at_lng(lng):
+        return lambda a, b: (a[0] + (b[0] - a[0]) * (lng - a[1]) / (b[1] - a[1]), lng)
+
+    for inside, cross in ((lambda p: p[0] >= south, at_lat(south)), (lambda p: p[0] <= north, at_lat(north)),
+                          (lambda p: p[1] >= west, at_lng(west)), (lambda p: p[1] <= east, at_lng(east))):
+        if not points:
+            break
+        points = clip(points, inside, cross)
+    return [p[0] for p in points], [p[1] for p in points]
+
+
+def snapped_edges(start, stop, step, origin):
+    """Multiples of `step` from `origin`, from the last one at or below start to the first at or above stop."""
+    first = int(math.floor((start - origin) / step))
+    last = int(math.ceil((stop - origin) / step - 1e-9))
+    return [origin + k * step for k in range(first, max(last, first + 1) + 1)]
+
+
+def tile_grid_edges(south, north, west, east, cell):
+    """(latitude edges, longitude edges) of the slippy-map tiles closest to `cell` degrees wide covering a box.
+
+    Tile rows are evenly spaced in web mercator, not in latitude, so the
+    latitude edges are taken from the tile rows themselves.
+    """
+    zoom = min(max(int(round(math.log(360.0 / cell, 2))), 0), 30)
+    top = latlng_to_tile(north, west, zoom)[1]
+    bottom = latlng_to_tile(south, west, zoom)[1]
+    lat_edges = [tile_lat(zoom, y) for y in range(bottom + 1, top - 1, -1)]
+    return lat_edges, snapped_edges(west, east, 360.0 / 2 ** zoom, -180.0)
+
+
+def geohash_grid_edges(south, north, west, east, cell):
+    """(latitude edges, longitude edges) of the geohash cells closest to `cell` degrees wide covering a box."""
+    lat_bits, lng_bits = geohash_bits(geohash_precision(cell))
+    return (snapped_edges(south, north, 180.0 / 2 ** lat_bits, -90.0),
+            snapped_edges(west, east, 360.0 / 2 ** lng_bits, -180.0))
+
+
+def grid_lines(lat_positions, lng_positions, south, north, west, east):
+    """Coords of grid line end points, two per line: parallels at lat_positions from west to east,
+    then meridians at lng_positions from south to north."""
+    lats = array('d')
+    lngs = array('d')
+    for lat in lat_positions:
+        lats.extend((lat, lat))
+        lngs.extend((west, east))
+    for lng in lng_positions:
+        lats.extend((south, north))
+        lngs.extend((lng, lng))
+    return Coords(lats, lngs)
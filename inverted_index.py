@@ -0,0 +1,312 @@
+'''
+Positional inverted index over the text files in search_files/.
+
+Every word of every document is recorded with its position (the word number in
+the document), so after one pass over the files these are all lookups:
+  - how often a word occurs               index.frequency('cheshire')
+  - how often a phrase occurs             index.phrase_count('cheshire cat')
+  - words near each other                 index.near('alice', 'queen', 5)
+  - words in one document but not another index.difference('AliceInWonderLand.txt',
+                                                            'AliceThroughTheLookingGlass.txt')
+Words are lower cased, so queries are case insensitive.
+
+On disk an index is a directory holding catalog.json (one entry per document
+with its size and modification time) and one segment file per document with
+that document's postings.  update() only reads files that are new or changed
+since the last save, and save() only writes their segments.
+
+Segment format: for each term in sorted order
+    varint term length, term (utf-8), varint number of positions,
+    positions as varint gaps from the previous position
+'''
+import bisect
+import glob
+import hashlib
+import json
+import os
+import time
+from array import array
+
+from tokenizer import split_line, tokens
+
+SEARCH_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_files')
+
+CATALOG_NAME = 'catalog.json'
+
+
+def encode_varint(value, out):
+    # 7 bits per byte, high bit set on every byte but the last
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, i):
+    # returns (value, index after the varint)
+    value = 0
+    shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+
+def encode_segment(postings):
+    out = bytearray()
+    for term in sorted(postings):
+        raw = term.encode('utf-8')
+        encode_varint(len(raw), out)
+        out += raw
+        positions = postings[term]
+        encode_varint(len(positions), out)
+        previous = 0
+        for position in positions:
+            encode_varint(position - previous, out)
+            previous = position
+    return bytes(out)
+
+
+def decode_segment(data):
+    postings = {}
+    i = 0
+    while i < len(data):
+        length, i = decode_varint(data, i)
+        term = data[i:i + length].decode('utf-8')
+        i += length
+        count, i = decode_varint(data, i)
+        positions = array('I')
+        position = 0
+        for _ in range(count):
+            gap, i = decode_varint(data, i)
+            position += gap
+            positions.append(position)
+        postings[term] = positions
+    return postings
+
+
+def file_postings(path):
+    # {term: array of positions} for one file
+    postings = {}
+    for position, word in enumerate(tokens(path, case='lower')):
+        positions = postings.get(word)
+        if positions is None:
+            positions = postings[word] = array('I')
+        positions.append(position)
+    return postings
+
+
+class InvertedIndex(object):
+    '''Positional index of documents, keyed by file name.'''
+
+    def __init__(self):
+        # term -> {document name: sorted array of positions}
+        self.postings = {}
+        # document name -> {'path', 'size', 'mtime', 'words'}
+        self.documents = {}
+        # document name -> its terms, so removing or saving a document doesn't scan every term
+        self.document_terms = {}
+        # documents whose segments save() still has to write
+        self.dirty = set()
+
+    @classmethod
+    def build(cls, directory=SEARCH_FILES, pattern='*.txt'):
+        index = cls()
+        index.update(directory, pattern)
+        return index
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, path, name=None):
+        '''Index a file (replacing any earlier version of the same document).'''
+        name = name or os.path.basename(path)
+        if name in self.documents:
+            self.remove(name)
+        postings = file_postings(path)
+        self._insert(name, postings)
+        stat = os.stat(path)
+        self.documents[name] = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                                'words': sum(len(positions) for positions in postings.values())}
+        self.dirty.add(name)
+
+    def _insert(self, name, postings):
+        for term, positions in postings.items():
+            self.postings.setdefault(term, {})[name] = positions
+        self.document_terms[name] = list(postings)
+
+    def remove(self, name):
+        for term in self.terms(name):
+            documents = self.postings[term]
+            del documents[name]
+            if not documents:
+                del self.postings[term]
+        del self.documents[name]
+        del self.document_terms[name]
+        self.dirty.discard(name)
+
+    def update(self, directory=SEARCH_FILES, pattern='*.txt'):
+        '''Index new and changed files matching pattern in directory and drop deleted ones.
+
+        Returns (added or changed names, removed names).
+        '''
+        found = {}
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            found[os.path.basename(path)] = path
+        changed = []
+        for name, path in found.items():
+            stat = os.stat(path)
+            known = self.documents.get(name)
+            if known is None or known['size'] != stat.st_size or known['mtime'] != stat.st_mtime:
+                self.add(path, name)
+                changed.append(name)
+        directory = os.path.abspath(directory)
+        removed = [name for name, document in self.documents.items()
+                   if name not in found and os.path.dirname(document['path']) == directory]
+        for name in removed:
+            self.remove(name)
+        return changed, removed
+
+    # ---- queries ----
+
+    def terms(self, name):
+        # every term of one document
+        return self.document_terms.get(name, [])
+
+    def positions(self, term, name):
+        return self.postings.get(term.lower(), {}).get(name, array('I'))
+
+    def frequency(self, term, name=None):
+        '''Occurrences of a word, in one document or (name=None) in all of them.'''
+        documents = self.postings.get(term.lower(), {})
+        if name is not None:
+            return len(documents.get(name, ()))
+        return sum(len(positions) for positions in documents.values())
+
+    def phrase_positions(self, phrase, name):
+        '''Positions in a document where the words of phrase occur one after another.'''
+        words = tokens_of(phrase)
+        if not words:
+            return []
+        starts = list(self.positions(words[0], name))
+        # check the rarer words first, so the candidate list shrinks fastest
+        rest = sorted(range(1, len(words)), key=lambda k: len(self.positions(words[k], name)))
+        for k in rest:
+            following = set(self.positions(words[k], name))
+            starts = [start for start in starts if start + k in following]
+            if not starts:
+                break
+        return starts
+
+    def phrase_count(self, phrase, name=None):
+        names = self.documents if name is None else [name]
+        return sum(len(self.phrase_positions(phrase, n)) for n in names)
+
+    def near(self, first, second, window, name=None):
+        '''Occurrences of first with an occurrence of second at most window words before or after it.'''
+        names = self.documents if name is None else [name]
+        count = 0
+        for n in names:
+            others = self.positions(second, n)
+            if not others:
+                continue
+            for position in self.positions(first, n):
+                i = bisect.bisect_left(others, position - window)
+                # skip the word itself when first and second are the same word
+                if i < len(others) and others[i] == position:
+                    i += 1
+                if i < len(others) and others[i] <= position + window:
+                    count += 1
+        return count
+
+    def difference(self, name, other):
+        '''Sorted words that occur in document name but not in document other.'''
+        return sorted(term for term in self.terms(name) if other not in self.postings[term])
+
+    # ---- storage ----
+
+    def save(self, directory):
+        '''Write the catalog and the segments of documents added since the last save or load.'''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        catalog = {}
+        for name, document in self.documents.items():
+            entry = dict(document)
+            entry['segment'] = segment_name(name)
+            catalog[name] = entry
+            path = os.path.join(directory, entry['segment'])
+            if name in self.dirty or not os.path.exists(path):
+                postings = dict((term, self.postings[term][name]) for term in self.terms(name))
+                with open(path, 'wb') as f:
+                    f.write(encode_segment(postings))
+        # segments of removed documents
+        catalog_path = os.path.join(directory, CATALOG_NAME)
+        if os.path.exists(catalog_path):
+            with open(catalog_path) as f:
+                for name, entry in json.load(f).items():
+                    if name not in catalog:
+                        stale = os.path.join(directory, entry['segment'])
+                        if os.path.exists(stale):
+                            os.remove(stale)
+        with open(catalog_path, 'w') as f:
+            json.dump(catalog, f, indent=1, sort_keys=True)
+        self.dirty.clear()
+
+    @classmethod
+    def load(cls, directory):
+        index = cls()
+        with open(os.path.join(directory, CATALOG_NAME)) as f:
+            catalog = json.load(f)
+        for name, entry in catalog.items():
+            with open(os.path.join(directory, entry.pop('segment')), 'rb') as f:
+                index._insert(name, decode_segment(f.read()))
+            index.documents[name] = entry
+        return index
+
+
+def segment_name(name):
+    # file names can hold anything, so segments are named by a hash of the document name
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:16] + '.seg'
+
+
+def tokens_of(text):
+    return [word.lower() for word in split_line(text)]
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    start = time.perf_counter()
+    index = InvertedIndex.build()
+    print('indexed %d files in %.3f s' % (len(index), time.perf_counter() - start))
+
+    wonderland = 'AliceInWonderLand.txt'
+    looking_glass = 'AliceThroughTheLookingGlass.txt'
+    print('"Cheshire" in Wonderland:', index.frequency('cheshire', wonderland))
+    print('"Cat" in Wonderland:', index.frequency('cat', wonderland))
+    print('"Cheshire Cat" in Wonderland:', index.phrase_count('cheshire cat', wonderland))
+    print('"Alice" within 3 words of "Queen", both books:',
+          index.near('alice', 'queen', 3, wonderland) + index.near('alice', 'queen', 3, looking_glass))
+    print('... in all %d files:' % len(index), index.near('alice', 'queen', 3))
+    only_wonderland = index.difference(wonderland, looking_glass)
+    print('%d words in Wonderland but not in Looking-Glass, e.g. %s'
+          % (len(only_wonderland), ', '.join(only_wonderland[:8])))
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        index.save(directory)
+        size = sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory))
+        print('saved in %.3f s, %d bytes on disk' % (time.perf_counter() - start, size))
+        start = time.perf_counter()
+        loaded = InvertedIndex.load(directory)
+        print('loaded in %.3f s' % (time.perf_counter() - start))
+        changed, removed = loaded.update()
+        print('update with no file changes re-indexed %d files' % len(changed))
+        assert loaded.phrase_count('cheshire cat') == index.phrase_count('cheshire cat')
+    finally:
+        shutil.rmtree(directory)
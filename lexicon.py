@@ -0,0 +1,312 @@
+'''
+Lexicon - load a word list (like search_files/dictionary.txt) once and answer
+queries on it without rereading the file.
+
+Lexicon keeps the words four ways:
+  - a sorted list        (longest words, binary search)
+  - a set                (membership in O(1))
+  - buckets by length    (all words of a given length)
+  - a prefix trie        (prefix counts and prefix listings in O(len(prefix)))
+
+save() writes the sorted words, their length buckets and offsets to a binary
+file.  load() memory-maps that file and answers the same queries straight from
+it, so a saved lexicon is ready as soon as the file is opened - no parsing.
+
+Words are stored in upper case (like dictionary.txt) and queries are upper
+cased too, so lookups are case insensitive.
+
+Example use:
+    words = Lexicon.from_file('search_files/dictionary.txt')
+    words.longest()            # ['ANTIDISESTABLISHMENTARIANISM']
+    'rabbit' in words          # True
+    words.with_prefix('WONDER')
+    words.save('dictionary.lex')
+    fast = load('dictionary.lex')
+'''
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_files', 'dictionary.txt')
+
+# File layout: header, then four uint32 arrays, then the words as one ascii blob.
+#   header          MAGIC, word count, longest word length
+#   offsets         word_count + 1 start offsets of the sorted words in the blob
+#   length_starts   max_length + 2 positions in by_length where each length begins
+#   by_length       word indices ordered by (length, word)
+MAGIC = b'LEX1'
+HEADER = struct.Struct('<4sII')
+
+# A trie node is a list [children, words below, is a word]; children maps letters to nodes.
+CHILDREN, COUNT, IS_WORD = 0, 1, 2
+
+
+def read_words(path):
+    # reads a word list with one word per line, skipping blank lines
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class Lexicon(object):
+    '''In-memory word index.  Build with Lexicon(words) or Lexicon.from_file(path).'''
+
+    def __init__(self, words):
+        self.words = sorted(set(word.upper() for word in words))
+        self.word_set = set(self.words)
+        self.by_length = {}
+        for word in self.words:
+            self.by_length.setdefault(len(word), []).append(word)
+        self.trie = [{}, 0, False]
+        for word in self.words:
+            self._trie_add(word)
+
+    @classmethod
+    def from_file(cls, path=DICTIONARY_PATH):
+        return cls(read_words(path))
+
+    def _trie_add(self, word):
+        node = self.trie
+        node[COUNT] += 1
+        for letter in word:
+            children = node[CHILDREN]
+            if letter not in children:
+                children[letter] = [{}, 0, False]
+            node = children[letter]
+            node[COUNT] += 1
+        node[IS_WORD] = True
+
+    def _trie_node(self, prefix):
+        node = self.trie
+        for letter in prefix:
+            node = node[CHILDREN].get(letter)
+            if node is None:
+                return None
+        return node
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word.upper() in self.word_set
+
+    def longest(self):
+        # every word tied for the longest length
+        if not self.words:
+            return []
+        return list(self.by_length[max(self.by_length)])
+
+    def of_length(self, length):
+        return list(self.by_length.get(length, []))
+
+    def count_prefix(self, prefix):
+        node = self._trie_node(prefix.upper())
+        return 0 if node is None else node[COUNT]
+
+    def with_prefix(self, prefix, limit=None):
+        # words starting with prefix, in alphabetical order (depth first walk of the trie)
+        prefix = prefix.upper()
+        node = self._trie_node(prefix)
+        found = []
+        if node is None:
+            return found
+        stack = [(prefix, node)]
+        while stack and (limit is None or len(found) < limit):
+            word, node = stack.pop()
+            if node[IS_WORD]:
+                found.append(word)
+            # push in reverse order so letters come off the stack alphabetically
+            for letter in sorted(node[CHILDREN], reverse=True):
+                stack.append((word + letter, node[CHILDREN][letter]))
+        return found
+
+    def save(self, path):
+        '''Write the lexicon to a binary file that load() can memory-map.'''
+        blob = '\n'.join(self.words).encode('ascii')
+        offsets = array('I')
+        position = 0
+        for word in self.words:
+            offsets.append(position)
+            position += len(word) + 1
+        offsets.append(position)
+
+        max_length = max(self.by_length) if self.by_length else 0
+        index = dict((word, i) for i, word in enumerate(self.words))
+        length_starts = array('I')
+        by_length = array('I')
+        for length in range(max_length + 1):
+            length_starts.append(len(by_length))
+            by_length.extend(index[word] for word in self.by_length.get(length, []))
+        length_starts.append(len(by_length))
+
+        for column in (offsets, length_starts, by_length):
+            if sys.byteorder != 'little':
+                column.byteswap()
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(self.words), max_length))
+            f.write(offsets.tobytes())
+            f.write(length_starts.tobytes())
+            f.write(by_length.tobytes())
+            f.write(blob)
+
+
+class MappedLexicon(object):
+    '''Read-only lexicon answering queries directly from a memory-mapped file written by Lexicon.save().
+
+    Membership and prefix queries are binary searches over the sorted words,
+    O(log n) each; nothing is parsed or copied when the file is opened.
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.max_length = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a saved lexicon' % path)
+        view = memoryview(self.map)
+        start = HEADER.size
+        sizes = (self.count + 1, self.max_length + 2, self.count)
+        columns = []
+        for size in sizes:
+            columns.append(view[start:start + 4 * size].cast('I'))
+            start += 4 * size
+        self.offsets, self.length_starts, self.by_length = columns
+        self.blob_start = start
+        if sys.byteorder != 'little':
+            # memoryview cannot swap bytes, so big endian machines pay for a copy
+            self.offsets, self.length_starts, self.by_length = [self._swapped(c) for c in columns]
+
+    @staticmethod
+    def _swapped(column):
+        copy = array('I', column.tobytes())
+        copy.byteswap()
+        return copy
+
+    def close(self):
+        self.offsets = self.length_starts = self.by_length = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def word(self, i):
+        # the i-th word in alphabetical order
+        start = self.blob_start + self.offsets[i]
+        end = self.blob_start + self.offsets[i + 1] - 1
+        return self.map[start:end].decode('ascii')
+
+    def _lower_bound(self, word):
+        # index of the first stored word >= word
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.word(middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __contains__(self, word):
+        word = word.upper()
+        i = self._lower_bound(word)
+        return i < self.count and self.word(i) == word
+
+    def of_length(self, length):
+        if length < 0 or length > self.max_length:
+            return []
+        start, end = self.length_starts[length], self.length_starts[length + 1]
+        return [self.word(self.by_length[i]) for i in range(start, end)]
+
+    def longest(self):
+        return self.of_length(self.max_length) if self.count else []
+
+    def _prefix_range(self, prefix):
+        prefix = prefix.upper()
+        start = self._lower_bound(prefix)
+        # every word with the prefix sorts before prefix followed by the highest character
+        end = self._lower_bound(prefix + '\x7f')
+        return start, end
+
+    def count_prefix(self, prefix):
+        start, end = self._prefix_range(prefix)
+        return end - start
+
+    def with_prefix(self, prefix, limit=None):
+        start, end = self._prefix_range(prefix)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self.word(i) for i in range(start, end)]
+
+
+def load(path):
+    return MappedLexicon(path)
+
+
+def scan_longest(path=DICTIONARY_PATH):
+    # the old way: read the file line by line for every query
+    longest = []
+    with open(path) as f:
+        for line in f:
+            word = line.strip()
+            if not longest or len(word) > len(longest[0]):
+                longest = [word]
+            elif len(word) == len(longest[0]) and word not in longest:
+                longest.append(word)
+    return longest
+
+
+def scan_contains(word, path=DICTIONARY_PATH):
+    word = word.upper()
+    with open(path) as f:
+        for line in f:
+            if line.strip() == word:
+                return True
+    return False
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    queries = ['cheshire', 'wonderland', 'rabbit', 'jabberwock', 'tulgey', 'alice']
+
+    start = time.perf_counter()
+    for word in queries:
+        scan_contains(word)
+    longest = scan_longest()
+    scan_time = time.perf_counter() - start
+    print('line by line scans:  %.4f s   longest: %s' % (scan_time, longest))
+
+    start = time.perf_counter()
+    words = Lexicon.from_file()
+    print('build lexicon:       %.4f s   %d words' % (time.perf_counter() - start, len(words)))
+
+    start = time.perf_counter()
+    for word in queries:
+        word in words
+    longest = words.longest()
+    print('lexicon queries:     %.6f s longest: %s' % (time.perf_counter() - start, longest))
+
+    path = os.path.join(tempfile.gettempdir(), 'dictionary.lex')
+    words.save(path)
+    start = time.perf_counter()
+    with load(path) as mapped:
+        opened = time.perf_counter() - start
+        membership = [word in mapped for word in queries]
+        print('open mapped file:    %.6f s  %d bytes' % (opened, os.path.getsize(path)))
+        print('mapped queries:      %.6f s' % (time.perf_counter() - start - opened))
+        print('membership:', dict(zip(queries, membership)))
+        print('prefix WONDER:', mapped.with_prefix('wonder'))
+        print('words starting with CAT:', mapped.count_prefix('cat'), '  seven letter words:', len(mapped.of_length(7)))
+        assert mapped.longest() == words.longest()
+        assert mapped.with_prefix('CAT') == words.with_prefix('CAT')
+        assert mapped.of_length(7) == words.of_length(7)
+    os.remove(path)
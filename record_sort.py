@@ -0,0 +1,148 @@
+'''
+Record sorting for files like files/nba_scoring_leaders.txt:
+
+    Dwyane Wade 21948
+    Gary Payton 21813
+
+one record per line, a name that may contain any number of spaces, and a
+number as the last field.
+
+parse_records() reads such a file into a RecordTable of two columns - the
+names, and the numbers in a compact array - instead of a 2d list.  Sorting
+sorts record numbers (an argsort) by the number column and never moves the
+rows themselves; top(k) only keeps the k best with heapq.nlargest.
+
+external_sort_records() sorts files too big for memory by their last field,
+with external_sort.py: the file is sorted in runs of max_records lines, each
+run is written to a temporary file, and the runs are merged with a heap.
+
+Example use:
+    players = parse_records('files/nba_scoring_leaders.txt')
+    for name, points in players.sorted_rows(reverse=True):
+        print(name, points)
+    players.top(5)
+'''
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+
+from external_sort import MEMORY_LIMIT, external_sort
+
+NBA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files', 'nba_scoring_leaders.txt')
+
+
+def split_record(line):
+    # ('Kareem Abdul Jabbar', '38387') from 'Kareem Abdul Jabbar 38387'; any whitespace separates fields
+    fields = line.split()
+    return ' '.join(fields[:-1]), fields[-1]
+
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def record_key(line):
+    # the number at the end of a record line
+    return parse_number(line.rstrip().rsplit(None, 1)[-1])
+
+
+class RecordTable(object):
+    '''Records stored by column: names (a list) and keys (an array of numbers).'''
+
+    def __init__(self, names, keys):
+        if len(names) != len(keys):
+            raise ValueError("names and keys must have the same length")
+        self.names = names
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def row(self, i):
+        return self.names[i], self.keys[i]
+
+    def argsort(self, reverse=False):
+        '''Record numbers in key order; records with equal keys stay in file order.'''
+        return sorted(range(len(self.keys)), key=self.keys.__getitem__, reverse=reverse)
+
+    def sorted_rows(self, reverse=False):
+        return [self.row(i) for i in self.argsort(reverse)]
+
+    def top(self, k, largest=True):
+        '''The k records with the largest (or smallest) keys, best first, without sorting the rest.'''
+        choose = heapq.nlargest if largest else heapq.nsmallest
+        return [self.row(i) for i in choose(k, range(len(self.keys)), key=self.keys.__getitem__)]
+
+
+def parse_records(path):
+    '''Read a file of "name ... number" lines into a RecordTable.  Blank lines are skipped.'''
+    names = []
+    numbers = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                name, number = split_record(line)
+                names.append(name)
+                numbers.append(parse_number(number))
+    typecode = 'q' if all(isinstance(number, int) for number in numbers) else 'd'
+    return RecordTable(names, array(typecode, numbers))
+
+
+def external_sort_records(path, output, reverse=False, max_records=100000, memory_limit=MEMORY_LIMIT):
+    '''Sort the lines of a record file by their last field into output, in runs of at most max_records lines.
+
+    Blank lines are dropped. Returns the number of sorted runs that were merged (see external_sort).
+    '''
+    return external_sort(path, output, key=record_key, reverse=reverse, memory_limit=memory_limit,
+                         max_lines=max_records, skip_blank=True)
+
+
+if __name__ == "__main__":
+    players = parse_records(NBA_PATH)
+    print('All time NBA scoring leaders')
+    for rank, (name, points) in enumerate(players.sorted_rows(reverse=True), 1):
+        print('%3d. %-25s %6d' % (rank, name, points))
+    print('top 3:', players.top(3))
+
+    # a file of made up records, sorted in memory and externally
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    directory = tempfile.mkdtemp()
+    try:
+        big = os.path.join(directory, 'records.txt')
+        with open(big, 'w') as f:
+            for i in range(count):
+                name, points = players.row(i % len(players))
+                f.write('%s %d\n' % (name, (points * 7919 + i * 104729) % 40000))
+
+        start = time.perf_counter()
+        table = parse_records(big)
+        print('\n%d records parsed in %.2f s' % (count, time.perf_counter() - start))
+        start = time.perf_counter()
+        order = table.argsort(reverse=True)
+        print('argsort:             %.2f s' % (time.perf_counter() - start))
+        start = time.perf_counter()
+        best = table.top(10)
+        print('top 10 with a heap:  %.2f s' % (time.perf_counter() - start))
+
+        rows = [[name, points] for name, points in zip(table.names, table.keys)]
+        start = time.perf_counter()
+        rows.sort(key=lambda row: row[1], reverse=True)
+        print('sorting a 2d list:   %.2f s' % (time.perf_counter() - start))
+
+        sorted_path = os.path.join(directory, 'sorted.txt')
+        start = time.perf_counter()
+        runs = external_sort_records(big, sorted_path, reverse=True, max_records=count // 8 + 1)
+        print('external sort in %d runs: %.2f s' % (runs, time.perf_counter() - start))
+        with open(sorted_path) as f:
+            external = [record_key(line) for line in f]
+        print('same order: %s   top 10 matches: %s'
+              % (external == [table.keys[i] for i in order], best == [table.row(i) for i in order[:10]]))
+    finally:
+        shutil.rmtree(directory)
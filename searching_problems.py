@@ -4,9 +4,13 @@ from class and from Ch15 of the textbook website
 '''
 import re
 
+# The word pattern is compiled once instead of on every call.
+# (tokenizer.py streams the same words out of whole files.)
+WORD_PATTERN = re.compile('[A-Za-z]+(?:\'[A-Za-z]+)?')
+
 # This function takes in a line of text and returns a list of words in the line.
 def split_line(line):
-    return re.findall('[A-Za-z]+(?:\'[A-Za-z]+)?', line)
+    return WORD_PATTERN.findall(line)
 
 #1.  (7pts) Write code which finds and prints the longest
 # word in the provided dictionary.  If there are more
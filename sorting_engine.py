@@ -0,0 +1,288 @@
+'''
+Sorting engine - the sorts from sorting_problems.py done properly, with
+instrumentation built in.
+
+Every sort takes (items, key=None, stats=None) and RETURNS a new sorted list,
+leaving items alone.  Pass a SortStats to find out how much work was done:
+    comparisons   key comparisons
+    swaps         element swaps, or element moves for the sorts that shift
+                  or merge instead of swapping
+    outer         iterations of the outer ("big") loop
+    inner         iterations of the inner loop
+
+    selection_sort         O(n^2) always, fewest swaps, not stable
+    insertion_sort         O(n^2), O(n) on sorted input, stable
+    binary_insertion_sort  insertion sort finding each spot by binary search
+    merge_sort             O(n log n) always, stable
+    hybrid_sort            Timsort-style: finds ascending/descending runs, grows
+                           short runs with binary insertion, merges runs from
+                           a stack; O(n) on sorted or reversed input, stable
+
+Example use:
+    stats = SortStats()
+    print(insertion_sort(sort_me3, stats=stats))
+    print(stats)
+'''
+import random
+import sys
+import time
+
+
+class SortStats(object):
+    def __init__(self):
+        self.comparisons = 0
+        self.swaps = 0
+        self.outer = 0
+        self.inner = 0
+
+    def add(self, comparisons=0, swaps=0, outer=0, inner=0):
+        self.comparisons += comparisons
+        self.swaps += swaps
+        self.outer += outer
+        self.inner += inner
+
+    def __str__(self):
+        return 'comparisons: %d  swaps: %d  outer loops: %d  inner loops: %d' % (
+            self.comparisons, self.swaps, self.outer, self.inner)
+
+
+def prepare(items, key):
+    # parallel lists of sort keys and values; the sorts move both together
+    values = list(items)
+    keys = values[:] if key is None else [key(value) for value in values]
+    return keys, values
+
+
+def selection_sort(items, key=None, stats=None):
+    keys, values = prepare(items, key)
+    n = len(keys)
+    comparisons = swaps = inner = 0
+    for i in range(n - 1):
+        smallest = i
+        for j in range(i + 1, n):
+            inner += 1
+            comparisons += 1
+            if keys[j] < keys[smallest]:
+                smallest = j
+        if smallest != i:
+            keys[i], keys[smallest] = keys[smallest], keys[i]
+            values[i], values[smallest] = values[smallest], values[i]
+            swaps += 1
+    if stats is not None:
+        stats.add(comparisons, swaps, max(n - 1, 0), inner)
+    return values
+
+
+def insertion_sort(items, key=None, stats=None):
+    keys, values = prepare(items, key)
+    comparisons = swaps = inner = 0
+    for i in range(1, len(keys)):
+        current_key, current = keys[i], values[i]
+        j = i - 1
+        while j >= 0:
+            comparisons += 1
+            if not current_key < keys[j]:
+                break
+            inner += 1
+            keys[j + 1], values[j + 1] = keys[j], values[j]
+            swaps += 1
+            j -= 1
+        keys[j + 1], values[j + 1] = current_key, current
+    if stats is not None:
+        stats.add(comparisons, swaps, max(len(keys) - 1, 0), inner)
+    return values
+
+
+def binary_insert(keys, values, lo, start, hi, counts):
+    # sorts keys[lo:hi] given keys[lo:start] is sorted; counts is [comparisons, swaps, outer, inner]
+    for i in range(start, hi):
+        current_key, current = keys[i], values[i]
+        left, right = lo, i
+        while left < right:
+            middle = (left + right) // 2
+            counts[0] += 1
+            counts[3] += 1
+            # insert after equal keys, which keeps the sort stable
+            if current_key < keys[middle]:
+                right = middle
+            else:
+                left = middle + 1
+        keys[left + 1:i + 1] = keys[left:i]
+        values[left + 1:i + 1] = values[left:i]
+        keys[left], values[left] = current_key, current
+        counts[1] += i - left
+        counts[2] += 1
+
+
+def binary_insertion_sort(items, key=None, stats=None):
+    keys, values = prepare(items, key)
+    counts = [0, 0, 0, 0]
+    binary_insert(keys, values, 0, 1, len(keys), counts)
+    if stats is not None:
+        stats.add(*counts)
+    return values
+
+
+def merge(keys, values, lo, mid, hi, counts):
+    # merges the sorted ranges [lo, mid) and [mid, hi) in place through a copy of the left range
+    left_keys, left_values = keys[lo:mid], values[lo:mid]
+    i, j, k = 0, mid, lo
+    left_end = mid - lo
+    comparisons = 0
+    while i < left_end and j < hi:
+        comparisons += 1
+        if keys[j] < left_keys[i]:
+            keys[k], values[k] = keys[j], values[j]
+            j += 1
+        else:
+            keys[k], values[k] = left_keys[i], left_values[i]
+            i += 1
+        k += 1
+    # whatever is left of the right range is already in place
+    keys[k:k + left_end - i] = left_keys[i:]
+    values[k:k + left_end - i] = left_values[i:]
+    counts[0] += comparisons
+    counts[1] += (k - lo) + (left_end - i)
+    counts[3] += comparisons
+
+
+def merge_sort(items, key=None, stats=None):
+    # bottom-up: merge runs of width 1, 2, 4, ...
+    keys, values = prepare(items, key)
+    n = len(keys)
+    counts = [0, 0, 0, 0]
+    width = 1
+    while width < n:
+        counts[2] += 1
+        for lo in range(0, n - width, 2 * width):
+            merge(keys, values, lo, lo + width, min(lo + 2 * width, n), counts)
+        width *= 2
+    if stats is not None:
+        stats.add(*counts)
+    return values
+
+
+def min_run(n):
+    # Timsort's run length: n / min_run is a power of two or just below, with 32 <= min_run <= 64
+    extra = 0
+    while n >= 64:
+        extra |= n & 1
+        n >>= 1
+    return n + extra
+
+
+def hybrid_sort(items, key=None, stats=None):
+    keys, values = prepare(items, key)
+    n = len(keys)
+    counts = [0, 0, 0, 0]
+    minimum = min_run(n)
+    runs = []
+    lo = 0
+    while lo < n:
+        counts[2] += 1
+        # find the run starting at lo; a strictly descending run is reversed, keeping the sort stable
+        hi = lo + 1
+        if hi < n:
+            counts[0] += 1
+            if keys[hi] < keys[lo]:
+                while hi + 1 < n:
+                    counts[0] += 1
+                    if not keys[hi + 1] < keys[hi]:
+                        break
+                    hi += 1
+                hi += 1
+                keys[lo:hi] = keys[lo:hi][::-1]
+                values[lo:hi] = values[lo:hi][::-1]
+                counts[1] += hi - lo
+            else:
+                while hi + 1 < n:
+                    counts[0] += 1
+                    if keys[hi + 1] < keys[hi]:
+                        break
+                    hi += 1
+                hi += 1
+        if hi - lo < minimum:
+            end = min(lo + minimum, n)
+            binary_insert(keys, values, lo, hi, end, counts)
+            hi = end
+        runs.append((lo, hi - lo))
+        merge_collapse(keys, values, runs, counts)
+        lo = hi
+    while len(runs) > 1:
+        merge_at(keys, values, runs, len(runs) - 2, counts)
+    if stats is not None:
+        stats.add(*counts)
+    return values
+
+
+def merge_collapse(keys, values, runs, counts):
+    # keeps run lengths on the stack shrinking fast enough that merges stay balanced;
+    # checking the invariant one run deeper too (i - 2) is the known fix to Timsort's original check
+    while len(runs) > 1:
+        i = len(runs) - 2
+        if ((i > 0 and runs[i - 1][1] <= runs[i][1] + runs[i + 1][1]) or
+                (i > 1 and runs[i - 2][1] <= runs[i - 1][1] + runs[i][1])):
+            if runs[i - 1][1] < runs[i + 1][1]:
+                i -= 1
+        elif runs[i][1] > runs[i + 1][1]:
+            break
+        merge_at(keys, values, runs, i, counts)
+
+
+def merge_at(keys, values, runs, i, counts):
+    lo, first = runs[i]
+    second = runs[i + 1][1]
+    merge(keys, values, lo, lo + first, lo + first + second, counts)
+    runs[i:i + 2] = [(lo, first + second)]
+
+
+SORTS = [selection_sort, insertion_sort, binary_insertion_sort, merge_sort, hybrid_sort]
+
+# sizes above which the O(n^2) sorts are left out of the benchmark
+QUADRATIC_LIMIT = {selection_sort: 5000, insertion_sort: 5000, binary_insertion_sort: 50000}
+
+
+def benchmark_inputs(n, seed=0):
+    rng = random.Random(seed)
+    shuffled = [rng.random() for _ in range(n)]
+    return [('random', shuffled),
+            ('sorted', sorted(shuffled)),
+            ('reversed', sorted(shuffled, reverse=True)),
+            ('few unique', [rng.randrange(8) for _ in range(n)])]
+
+
+def benchmark(max_size=10 ** 6, sorts=SORTS):
+    '''Time every sort on random, sorted, reversed and few-unique inputs of 10, 100, ... max_size items.'''
+    rows = []
+    n = 10
+    while n <= max_size:
+        for label, data in benchmark_inputs(n):
+            expected = sorted(data)
+            for sort in sorts:
+                if n > QUADRATIC_LIMIT.get(sort, n):
+                    continue
+                stats = SortStats()
+                start = time.perf_counter()
+                result = sort(data, stats=stats)
+                elapsed = time.perf_counter() - start
+                if result != expected:
+                    raise AssertionError('%s failed on %s input of %d' % (sort.__name__, label, n))
+                rows.append((n, label, sort.__name__, elapsed, stats))
+        n *= 10
+    return rows
+
+
+if __name__ == "__main__":
+    from sorting_problems import sort_me3, sort_me4
+
+    for name, data in (('sort_me3', sort_me3), ('sort_me4', sort_me4)):
+        for sort in SORTS:
+            stats = SortStats()
+            sort(data, stats=stats)
+            print('%-9s %-22s %s' % (name, sort.__name__, stats))
+        print()
+
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    print('%9s %-11s %-22s %10s %12s %12s' % ('n', 'input', 'sort', 'seconds', 'comparisons', 'swaps'))
+    for n, label, name, elapsed, stats in benchmark(max_size):
+        print('%9d %-11s %-22s %10.4f %12d %12d' % (n, label, name, elapsed, stats.comparisons, stats.swaps))
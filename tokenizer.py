@@ -0,0 +1,167 @@
+'''
+Streaming word tokenizer for big text files.
+
+Finds the same words as split_line in searching_problems.py (letters, with
+one optional apostrophe part like "Alice's"), but
+  - the pattern is compiled once,
+  - files are read in large binary chunks (or memory-mapped), not line by line,
+  - words are yielded one at a time, so memory does not grow with the file.
+
+A chunk is only tokenized up to its last byte that cannot be part of a word;
+the rest is carried over to the next chunk, so no word is ever cut in two.
+
+Example use:
+    for word in tokens('search_files/AliceInWonderLand.txt', case='lower'):
+        ...
+'''
+import mmap
+import os
+import re
+import time
+
+# the split_line pattern, compiled once; BYTES_WORD_PATTERN matches the same words in raw bytes
+WORD_PATTERN = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+BYTES_WORD_PATTERN = re.compile(rb"[A-Za-z]+(?:'[A-Za-z]+)?")
+
+# bytes a word can contain: a chunk may only be cut after a byte outside this set
+WORD_CHARS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'"
+WORD_BYTES = frozenset(WORD_CHARS)
+
+CHUNK_SIZE = 1 << 20
+
+SEARCH_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_files')
+
+CASES = (None, 'lower', 'upper')
+
+
+def split_line(line):
+    # same result as searching_problems.split_line, without compiling the pattern on every call
+    return WORD_PATTERN.findall(line)
+
+
+def safe_end(data):
+    # length of the longest prefix of data that ends outside a word (0 if there is none)
+    i = len(data)
+    while i and data[i - 1] in WORD_BYTES:
+        i -= 1
+    return i
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE, limit=None):
+    '''Yield byte chunks of a binary file object, each ending outside a word.
+
+    Reads at most `limit` bytes from the current position if limit is given,
+    then keeps reading only until the word in progress is finished.
+    '''
+    carry = b''
+    remaining = limit
+    while True:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        data = f.read(size) if size else b''
+        if remaining is not None:
+            remaining -= len(data)
+        if not data:
+            if remaining is not None and carry:
+                # finish a word running past the limit
+                while True:
+                    data = f.read(64)
+                    end = len(data) - len(data.lstrip(WORD_CHARS))
+                    carry += data[:end]
+                    if end < len(data) or not data:
+                        break
+            if carry:
+                yield carry
+            return
+        data = carry + data
+        end = safe_end(data)
+        carry = data[end:]
+        if end:
+            yield data[:end]
+
+
+def normalized(chunk, case):
+    if case is None:
+        return chunk
+    if case == 'lower':
+        return chunk.lower()
+    if case == 'upper':
+        return chunk.upper()
+    raise ValueError("case must be one of %r" % (CASES,))
+
+
+def chunk_words(source, chunk_size=CHUNK_SIZE, case=None):
+    '''Yield a list of words per chunk of a file, for callers that work in batches.
+
+    source is a path or a binary file object.
+    '''
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for words in chunk_words(f, chunk_size, case):
+                yield words
+        return
+    findall = WORD_PATTERN.findall
+    for chunk in read_chunks(source, chunk_size):
+        # latin-1 maps every byte to one character, and bytes of multi-byte utf-8
+        # characters never match the pattern, so the words are the same as in the utf-8 text
+        yield findall(normalized(chunk, case).decode('latin-1'))
+
+
+def tokens(source, chunk_size=CHUNK_SIZE, case=None):
+    '''Yield the words of a file one by one.
+
+    source is a path or a binary file object; case is None, 'lower' or 'upper'.
+    '''
+    for words in chunk_words(source, chunk_size, case):
+        for word in words:
+            yield word
+
+
+def mmap_tokens(path, case=None):
+    # tokenize a whole file through mmap: no chunk boundaries at all, the OS pages it in
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for match in BYTES_WORD_PATTERN.finditer(data):
+                yield normalized(match.group(), case).decode('ascii')
+
+
+def best_time(run, repeat=5):
+    # fastest of several runs, and the result of the last one
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def split_line_words(path, split):
+    # the searching_problems way: read line by line and split each line
+    words = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            words.extend(split(line))
+    return words
+
+
+def original_split_line(line):
+    # split_line as searching_problems.py first had it, handing the pattern string to re on every call
+    return re.findall('[A-Za-z]+(?:\'[A-Za-z]+)?', line)
+
+
+if __name__ == "__main__":
+    for name in ('AliceInWonderLand.txt', 'AliceThroughTheLookingGlass.txt'):
+        path = os.path.join(SEARCH_FILES, name)
+        print(name)
+        baseline, expected = best_time(lambda: split_line_words(path, original_split_line))
+        print('  %-30s %.4f s  %d words' % ('split_line, line by line', baseline, len(expected)))
+
+        for label, run in (('split_line, compiled pattern', lambda: split_line_words(path, split_line)),
+                           ('tokens, 1 MB chunks', lambda: list(tokens(path))),
+                           ('tokens, 4 kB chunks', lambda: list(tokens(path, 4096))),
+                           ('tokens, 7 byte chunks', lambda: list(tokens(path, 7))),
+                           ('mmap_tokens', lambda: list(mmap_tokens(path)))):
+            elapsed, words = best_time(run)
+            print('  %-30s %.4f s  %4.1fx  same words: %s' % (label, elapsed, baseline / elapsed, words == expected))
@@ -0,0 +1,223 @@
+'''
+Approximate word counting in bounded memory, for text streams whose
+vocabulary is too big for an exact Counter.
+
+CountMinSketch answers "how often did this word occur?".  The answer is never
+too low, and for any one word, with probability 1 - delta it is at most
+epsilon * (total words) too high.  That is a per-query guarantee: over a whole
+vocabulary, about a delta fraction of the words can be off by more.  Memory is
+fixed by epsilon and delta, not by the vocabulary.
+
+SpaceSaving keeps the heavy hitters: with `capacity` counters it holds every
+word occurring more than total / capacity times, each with an upper bound on
+how much its count may be overestimated.
+
+Both are mergeable: sketches built on separate shards of a corpus (with the
+same parameters) can be added together, giving the sketch of the whole corpus.
+Words come from the split_line tokenization (see tokenizer.py).
+
+Example use:
+    counts = CountMinSketch(epsilon=0.0005, delta=0.01)
+    heavy = SpaceSaving(100)
+    for words in chunk_words('search_files/AliceInWonderLand.txt', case='lower'):
+        counts.update(words)
+        heavy.update(words)
+    counts.estimate('alice'), heavy.top(10)
+'''
+import hashlib
+import heapq
+import math
+import os
+import sys
+import time
+from array import array
+from collections import Counter
+
+from tokenizer import SEARCH_FILES, chunk_words
+
+
+def word_hashes(word, seed):
+    # two independent 32 bit hashes of a word; stable across processes, unlike hash()
+    digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8, salt=seed).digest()
+    return int.from_bytes(digest[:4], 'little'), int.from_bytes(digest[4:], 'little') | 1
+
+
+class CountMinSketch(object):
+    '''depth rows of width counters; a word adds to one counter per row and its estimate is the row minimum.'''
+
+    def __init__(self, epsilon=0.001, delta=0.01, width=None, depth=None, seed=b''):
+        self.width = width or int(math.ceil(math.e / epsilon))
+        self.depth = depth or int(math.ceil(math.log(1.0 / delta)))
+        self.seed = seed
+        self.rows = [array('Q', bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0
+
+    @property
+    def nbytes(self):
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+    def columns(self, word):
+        # counter index of the word in each row (double hashing: h1 + i * h2)
+        h1, h2 = word_hashes(word, self.seed)
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, word, count=1):
+        for row, column in zip(self.rows, self.columns(word)):
+            row[column] += count
+        self.total += count
+
+    def update(self, words):
+        # count repeats within the batch first, so each distinct word is hashed once
+        for word, count in Counter(words).items():
+            self.add(word, count)
+
+    def estimate(self, word):
+        return min(row[column] for row, column in zip(self.rows, self.columns(word)))
+
+    def error_bound(self):
+        # per query: any one word's estimate is, with probability 1 - delta, at most this over its true count
+        return math.e / self.width * self.total
+
+    def merge(self, other):
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("only sketches with the same width, depth and seed can be merged")
+        for row, other_row in zip(self.rows, other.rows):
+            for i, value in enumerate(other_row):
+                if value:
+                    row[i] += value
+        self.total += other.total
+        return self
+
+
+class SpaceSaving(object):
+    '''Heavy hitters with a fixed number of counters (Metwally, Agrawal and El Abbadi).
+
+    When all counters are taken, a new word replaces the word with the smallest
+    count and inherits that count as its possible overestimate (error).
+    '''
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        # word -> [count, error]
+        self.counters = {}
+        # (count, word) entries, some stale; the live minimum is found by skipping them
+        self.heap = []
+        self.total = 0
+
+    @property
+    def nbytes(self):
+        return len(self.counters) * 3 * 8 + len(self.heap) * 2 * 8
+
+    def add(self, word, count=1):
+        self.total += count
+        counter = self.counters.get(word)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[word] = [count, 0]
+        else:
+            smallest, evicted = self._pop_min()
+            del self.counters[evicted]
+            counter = self.counters[word] = [smallest + count, smallest]
+        heapq.heappush(self.heap, (counter[0], word))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c[0], w) for w, c in self.counters.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_min(self):
+        heap = self.heap
+        while True:
+            count, word = heapq.heappop(heap)
+            counter = self.counters.get(word)
+            if counter is not None and counter[0] == count:
+                return count, word
+
+    def update(self, words):
+        # frequent words of the batch go first, so the rare ones are the ones competing for the last counters
+        for word, count in Counter(words).most_common():
+            self.add(word, count)
+
+    def minimum(self):
+        # count a word not being tracked can have at most
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def top(self, n=10):
+        '''[(word, count, error)] for the n largest counters; the true count is between count - error and count.'''
+        best = heapq.nlargest(n, self.counters.items(), key=lambda item: item[1][0])
+        return [(word, counter[0], counter[1]) for word, counter in best]
+
+    def merge(self, other):
+        '''Combine with a summary of another shard, keeping the capacity largest counters.'''
+        mine, theirs = self.minimum(), other.minimum()
+        merged = {}
+        for word in set(self.counters) | set(other.counters):
+            a = self.counters.get(word, [mine, mine])
+            b = other.counters.get(word, [theirs, theirs])
+            merged[word] = [a[0] + b[0], a[1] + b[1]]
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0])
+        self.counters = dict(kept)
+        self.heap = [(counter[0], word) for word, counter in kept]
+        heapq.heapify(self.heap)
+        self.total += other.total
+        return self
+
+
+def sketch_file(path, epsilon=0.001, delta=0.01, capacity=100, case='lower'):
+    # (CountMinSketch, SpaceSaving) of every word in a file
+    counts = CountMinSketch(epsilon, delta)
+    heavy = SpaceSaving(capacity)
+    for words in chunk_words(path, case=case):
+        counts.update(words)
+        heavy.update(words)
+    return counts, heavy
+
+
+def exact_counts(path, case='lower'):
+    counts = Counter()
+    for words in chunk_words(path, case=case):
+        counts.update(words)
+    return counts
+
+
+def counter_bytes(counts):
+    # rough memory of a Counter: the table plus its key strings and int values
+    return sys.getsizeof(counts) + sum(sys.getsizeof(word) + 28 for word in counts)
+
+
+if __name__ == "__main__":
+    paths = [os.path.join(SEARCH_FILES, name)
+             for name in ('AliceInWonderLand.txt', 'AliceThroughTheLookingGlass.txt')]
+
+    for path in paths:
+        start = time.perf_counter()
+        exact = exact_counts(path)
+        exact_time = time.perf_counter() - start
+        print('%s: %d words, %d distinct, exact Counter %.3f s, ~%d kB'
+              % (os.path.basename(path), sum(exact.values()), len(exact), exact_time, counter_bytes(exact) // 1000))
+        for epsilon in (0.01, 0.001, 0.0001):
+            start = time.perf_counter()
+            counts, heavy = sketch_file(path, epsilon=epsilon, capacity=200)
+            elapsed = time.perf_counter() - start
+            errors = [counts.estimate(word) - count for word, count in exact.items()]
+            bound = counts.error_bound()
+            over = sum(1 for error in errors if error > bound) / len(errors)
+            top = set(word for word, count in exact.most_common(10))
+            found = set(word for word, count, error in heavy.top(10))
+            print('  epsilon %-7g %6.3f s  %7d bytes  mean error %6.2f  max error %4d  per-word 99%% bound %6.1f,'
+                  ' %.2f%% of words over it  top 10 recall %d/10'
+                  % (epsilon, elapsed, counts.nbytes, sum(errors) / len(errors), max(errors),
+                     bound, 100 * over, len(top & found)))
+
+    # sketches of both books, built separately and merged, match a sketch of both
+    first, first_heavy = sketch_file(paths[0], capacity=200)
+    second, second_heavy = sketch_file(paths[1], capacity=200)
+    first.merge(second)
+    first_heavy.merge(second_heavy)
+    both = exact_counts(paths[0]) + exact_counts(paths[1])
+    print('merged: alice %d (exact %d), queen %d (exact %d)'
+          % (first.estimate('alice'), both['alice'], first.estimate('queen'), both['queen']))
+    print('merged heavy hitters:', [word for word, count, error in first_heavy.top(10)])
+    print('exact heavy hitters: ', [word for word, count in both.most_common(10)])
@@ -0,0 +1,165 @@
+'''
+Parallel word statistics (the searching_problems.py questions, for big corpora).
+
+The corpus - one or more text files - is cut into byte ranges (shards).  Each
+shard is tokenized in its own process, giving a word Counter and a word length
+histogram; the partial results are then added together.
+
+A shard owns the words that start inside its byte range: it skips a word
+running into its start from the previous shard, and reads past its end to
+finish its own last word.  So every word is counted exactly once and none is
+split, whatever the shard boundaries are.
+
+Example use:
+    stats = word_stats(['search_files/AliceInWonderLand.txt'])
+    stats.words, stats.average_length()
+    stats.most_common_of_length(7)
+    stats.longest(5)
+'''
+import heapq
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from tokenizer import SEARCH_FILES, WORD_BYTES, WORD_PATTERN, normalized, read_chunks
+
+# shards smaller than this are not worth a process
+MIN_SHARD_SIZE = 1 << 20
+
+
+class WordStats(object):
+    '''Mergeable word statistics: word counts, length histogram, total words and letters.'''
+
+    def __init__(self, counts=None, lengths=None):
+        self.counts = counts if counts is not None else Counter()
+        self.lengths = lengths if lengths is not None else Counter()
+
+    @property
+    def words(self):
+        return sum(self.lengths.values())
+
+    @property
+    def letters(self):
+        return sum(length * count for length, count in self.lengths.items())
+
+    def average_length(self):
+        return self.letters / self.words if self.words else 0.0
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.lengths.update(other.lengths)
+        return self
+
+    def most_common_of_length(self, length, n=1):
+        # the n most frequent words with exactly this many characters
+        return heapq.nlargest(n, ((count, word) for word, count in self.counts.items() if len(word) == length))
+
+    def longest(self, k=1):
+        # the k longest distinct words (ties broken alphabetically), with a heap instead of sorting the vocabulary
+        return [word for length, word in
+                heapq.nsmallest(k, ((-len(word), word) for word in self.counts))]
+
+
+def shard_ranges(paths, shard_size):
+    # (path, start, end) byte ranges covering every file
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, shard_size):
+            shards.append((path, start, min(start + shard_size, size)))
+    return shards
+
+
+def shard_stats(shard, case='lower'):
+    '''WordStats of the words that start in one (path, start, end) byte range.
+
+    A word crossing the start of the range belongs to the range before it; a
+    word crossing the end is read to its last byte.
+    '''
+    path, start, end = shard
+    counts = Counter()
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            if f.read(1)[0] in WORD_BYTES:
+                # the word at start began in the previous shard, which counts it
+                while True:
+                    byte = f.read(1)
+                    start += 1
+                    if not byte or byte[0] not in WORD_BYTES:
+                        break
+                if start >= end:
+                    return WordStats(counts, Counter())
+            f.seek(start)
+        findall = WORD_PATTERN.findall
+        for chunk in read_chunks(f, limit=end - start):
+            counts.update(findall(normalized(chunk, case).decode('latin-1')))
+    lengths = Counter()
+    for word, count in counts.items():
+        lengths[len(word)] += count
+    return WordStats(counts, lengths)
+
+
+def word_stats(paths, processes=None, shard_size=None, case='lower'):
+    '''Word statistics of a list of files, tokenized in parallel.
+
+    processes=0 runs everything in this process.  shard_size defaults to
+    about four shards per worker, and at least MIN_SHARD_SIZE bytes.
+    '''
+    if isinstance(paths, str):
+        paths = [paths]
+    workers = processes or os.cpu_count() or 1
+    if shard_size is None:
+        total = sum(os.path.getsize(path) for path in paths)
+        shard_size = max(MIN_SHARD_SIZE, total // (4 * workers) + 1)
+    shards = shard_ranges(paths, shard_size)
+    stats = WordStats()
+    if processes == 0 or len(shards) < 2:
+        for shard in shards:
+            stats.merge(shard_stats(shard, case))
+        return stats
+    cases = [case] * len(shards)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for partial in pool.map(shard_stats, shards, cases):
+            stats.merge(partial)
+    return stats
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    alice = [os.path.join(SEARCH_FILES, name)
+             for name in ('AliceInWonderLand.txt', 'AliceThroughTheLookingGlass.txt')]
+    stats = word_stats(alice[:1], processes=0)
+    print('AliceInWonderLand.txt: %d words, average length %.2f' % (stats.words, stats.average_length()))
+    print('most frequent 7 letter words:', stats.most_common_of_length(7, 3))
+    print('longest words:', stats.longest(5))
+
+    # a bigger corpus: both books repeated, checked against a single shard
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    directory = tempfile.mkdtemp()
+    try:
+        big = os.path.join(directory, 'corpus.txt')
+        with open(big, 'wb') as out:
+            for _ in range(copies):
+                for path in alice:
+                    with open(path, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+        print('\ncorpus of %.1f MB' % (os.path.getsize(big) / 1e6))
+        start = time.perf_counter()
+        whole = word_stats(big, processes=0, shard_size=os.path.getsize(big))
+        baseline = time.perf_counter() - start
+        print('%-28s %7.3f s' % ('one shard, one process', baseline))
+        runs = [(0, 1 << 20)] + [(n, None) for n in sorted(set((1, 2, 4, os.cpu_count() or 1)))]
+        for processes, shard_size in runs:
+            start = time.perf_counter()
+            sharded = word_stats(big, processes=processes, shard_size=shard_size)
+            elapsed = time.perf_counter() - start
+            label = 'pool of %d' % processes if processes else '1 MB shards, no pool'
+            print('%-28s %7.3f s  %4.2fx  same counts: %s'
+                  % (label, elapsed, baseline / elapsed, sharded.counts == whole.counts))
+    finally:
+        shutil.rmtree(directory)